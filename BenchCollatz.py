@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+# --------------------------------
+# projects/collatz/BenchCollatz.py
+# Copyright (C) 2011
+# Glenn P. Downing
+# --------------------------------
+
+"""
+To time every workload with every engine, on a cold and a warm cycle
+cache (with the result cache and the record holders off), then from
+the result cache
+    % python BenchCollatz.py
+
+To leave the record holders (see check_meta) on for the cold and
+warm rows; every full range then holds one, so those rows only
+time check_meta
+    % python BenchCollatz.py -M
+
+To time some of them, with 500 queries per workload
+    % python BenchCollatz.py -e int -e jump -l small -l hot -n 500
+
+To save the results, then check a later run against them
+(exits with 1 if any result is more than 20% slower)
+    % python BenchCollatz.py -o Collatz.bench
+    % python BenchCollatz.py -c Collatz.bench -r 0.2
+
+To time filling a cold cache of 1..N forward with every engine
+and by growing the inverse tree (collatz_tree_fill), for two N
+    % python BenchCollatz.py -F 1000000 -F 10000000
+    % python BenchCollatz.py -F 100000000 -e numpy -e tree
+
+The -i and -w options are those of RunCollatz.py.
+"""
+
+# -------
+# imports
+# -------
+
+import argparse
+import json
+import platform
+import random
+import StringIO
+import sys
+import time
+
+import Collatz
+from Collatz import collatz_solve, collatz_range_index, collatz_workers, collatz_result_cache, collatz_fill, \
+                    collatz_engine, collatz_tree_fill, CycleCache, HighCache, \
+                    COLLATZ_ENGINES, MAX_RANGE, HIGH_LIMIT
+
+# ---------
+# workloads
+# ---------
+
+def random_ranges (rand, n) :
+    """
+    any range in the cache
+    """
+    return [(rand.randint(1, MAX_RANGE - 1), rand.randint(1, MAX_RANGE - 1)) for q in xrange(n)]
+
+def small_ranges (rand, n) :
+    """
+    ranges of at most 100 numbers in the cache
+    """
+    queries = []
+    for q in xrange(n) :
+        i = rand.randint(1, MAX_RANGE - 100)
+        queries.append((i, i + rand.randint(0, 99)))
+    return queries
+
+def full_ranges (rand, n) :
+    """
+    ranges over nearly all the cache
+    """
+    return [(rand.randint(1, 1000), rand.randint(MAX_RANGE - 1000, MAX_RANGE - 1)) for q in xrange(n)]
+
+def hot_ranges (rand, n) :
+    """
+    the same 8 ranges over and over
+    """
+    hot = random_ranges(rand, 8)
+    return [rand.choice(hot) for q in xrange(n)]
+
+def high_ranges (rand, n) :
+    """
+    ranges of at most 1000 numbers past the cache
+    """
+    queries = []
+    for q in xrange(n) :
+        i = rand.randint(MAX_RANGE, 10 * MAX_RANGE)
+        queries.append((i, i + rand.randint(0, 999)))
+    return queries
+
+def huge_ranges (rand, n) :
+    """
+    ranges of at most 4 numbers from 2^64 to 2^10000
+    """
+    queries = []
+    for q in xrange(n) :
+        i = (1 << rand.randint(64, 10000)) + rand.randint(0, 1 << 32)
+        queries.append((i, i + rand.randint(0, 3)))
+    return queries
+
+WORKLOADS = {
+    "random" : random_ranges,
+    "small"  : small_ranges,
+    "full"   : full_ranges,
+    "hot"    : hot_ranges,
+    "high"   : high_ranges,
+    "huge"   : huge_ranges}
+
+# ------
+# timing
+# ------
+
+class TimedWriter (object) :
+    """
+    a writer that keeps the time between its writes;
+    collatz_solve writes once per query, so these
+    are the query latencies
+    """
+
+    def __init__ (self) :
+        self.times = []
+        self.last  = time.time()
+
+    def write (self, s) :
+        now = time.time()
+        self.times.append(now - self.last)
+        self.last = now
+
+def percentile (times, p) :
+    """
+    times is a sorted list
+    return the p-th percentile of times (nearest rank)
+    """
+    k = max(int(round(p / 100.0 * len(times))) - 1, 0)
+    return times[k]
+
+def bench_run (queries, engine) :
+    """
+    runs the queries through collatz_solve
+    return a dict of the throughput and latencies
+    """
+    r = StringIO.StringIO("".join("%d %d\n" % q for q in queries))
+    w = TimedWriter()
+    start = time.time()
+    collatz_solve(r, w, engine)
+    total = time.time() - start
+    times = sorted(w.times)
+    return {
+        "queries" : len(times),
+        "seconds" : total,
+        "qps"     : len(times) / total if total else 0.0,
+        "p50"     : percentile(times, 50),
+        "p90"     : percentile(times, 90),
+        "p99"     : percentile(times, 99),
+        "max"     : times[-1]}
+
+def bench_cold (index) :
+    """
+    throws away the cycle cache (and the range-max index),
+    and turns the result cache off so the engine runs
+    measure the cycle cache
+    """
+    Collatz.cycle_list = CycleCache(MAX_RANGE, HighCache(HIGH_LIMIT))
+    collatz_result_cache(0)
+    if index :
+        collatz_range_index(index)
+
+# the meta data as loaded, for bench_records
+RECORDS = Collatz.META_DICT, Collatz.META_KEYS, Collatz.META_LIMIT
+
+def bench_records (on) :
+    """
+    turns the record holder shortcut (see check_meta) on or
+    off; off, a range holding a record holder is computed
+    like any other
+    """
+    if on :
+        Collatz.META_DICT, Collatz.META_KEYS, Collatz.META_LIMIT = RECORDS
+    else :
+        Collatz.META_DICT, Collatz.META_KEYS, Collatz.META_LIMIT = {}, [], 0
+
+def bench_fill (size, engine) :
+    """
+    return the seconds it takes to fill a cold cache of
+    1..size with the engine, walking forward from every
+    number, or with collatz_tree_fill if engine is "tree"
+    """
+    saved = Collatz.cycle_list
+    Collatz.cycle_list = CycleCache(size + 1)
+    try :
+        start = time.time()
+        if engine == "tree" :
+            collatz_tree_fill()
+        else :
+            collatz_fill(collatz_engine(engine), 1, size)
+        return time.time() - start
+    finally :
+        Collatz.cycle_list = saved
+
+# latency differences below this many seconds are noise
+BENCH_SLACK = 0.0001
+
+def bench_check (results, baseline, ratio) :
+    """
+    return a list of the results slower than in the
+    baseline by more than ratio, as lines to print
+    """
+    slower = []
+    for key in sorted(results) :
+        if key not in baseline :
+            continue
+        old = baseline[key]
+        new = results[key]
+        if new["qps"] < old["qps"] * (1 - ratio) :
+            slower.append("%s qps %.1f -> %.1f" % (key, old["qps"], new["qps"]))
+        if new["p99"] > old["p99"] * (1 + ratio) + BENCH_SLACK :
+            slower.append("%s p99 %.6f -> %.6f" % (key, old["p99"], new["p99"]))
+    return slower
+
+# ----
+# main
+# ----
+
+parser = argparse.ArgumentParser(description="collatz benchmarks")
+parser.add_argument("-e", "--engine", action="append", help="cycle length engine, all if none")
+parser.add_argument("-l", "--workload", action="append", help="workload, all if none")
+parser.add_argument("-n", "--queries", type=int, default=200, help="queries per workload")
+parser.add_argument("-s", "--seed", type=int, default=373, help="workload random seed")
+parser.add_argument("-o", "--output", help="JSON file to write the results to")
+parser.add_argument("-c", "--compare", help="JSON file of baseline results")
+parser.add_argument("-r", "--ratio", type=float, default=0.2, help="slowdown over the baseline that fails")
+parser.add_argument("-F", "--fill", type=int, action="append", metavar="N", help="time filling 1..N instead")
+parser.add_argument("-i", "--index", type=int, metavar="BLOCK", help="range-max index block size")
+parser.add_argument("-w", "--workers", type=int, help="worker processes for big ranges")
+parser.add_argument("-M", "--meta", action="store_true", help="keep the record holders on for cold and warm")
+
+def bench_main (args) :
+    """
+    runs the benchmarks args asks for
+    args is the parsed command line
+    """
+    if args.fill :
+        for size in args.fill :
+            for engine in args.engine or sorted(COLLATZ_ENGINES) + ["tree"] :
+                print "fill/%d/%-10s %10.2f s" % (size, engine, bench_fill(size, engine))
+        return
+
+    engines   = args.engine or sorted(COLLATZ_ENGINES)
+    workloads = args.workload or sorted(WORKLOADS)
+    if args.workers :
+        collatz_workers(args.workers)
+    bench_records(args.meta)
+
+    results = {}
+    for name in workloads :
+        queries = WORKLOADS[name](random.Random(args.seed), args.queries)
+        for engine in engines :
+            bench_cold(args.index)
+            for cache in ("cold", "warm", "results") :
+
+                # results: a second run with the result cache on,
+                # every query answered by a result cache hit
+                if cache == "results" :
+                    collatz_result_cache()
+                    bench_run(queries, engine)
+                key = "%s/%s/%s" % (name, engine, cache)
+                results[key] = bench_run(queries, engine)
+                print "%-20s %10.1f qps  p50 %.6f  p90 %.6f  p99 %.6f  max %.6f" % \
+                    ((key, ) + tuple(results[key][k] for k in ("qps", "p50", "p90", "p99", "max")))
+
+    if args.output :
+        w = open(args.output, "w")
+        try :
+            json.dump({
+                "python"  : platform.python_version(),
+                "meta"    : args.meta,
+                "queries" : args.queries,
+                "seed"    : args.seed,
+                "results" : results}, w, indent=1, sort_keys=True)
+        finally :
+            w.close()
+
+    if args.compare :
+        r = open(args.compare)
+        try :
+            baseline = json.load(r)["results"]
+        finally :
+            r.close()
+        slower = bench_check(results, baseline, args.ratio)
+        for line in slower :
+            print "slower:", line
+        if slower :
+            sys.exit(1)
+
+if __name__ == "__main__" :
+    bench_main(parser.parse_args())
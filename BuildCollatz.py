@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+
+# --------------------------------
+# projects/collatz/BuildCollatz.py
+# Copyright (C) 2011
+# Glenn P. Downing
+# --------------------------------
+
+"""
+To build a table of the cycle lengths of 1..N
+    % python BuildCollatz.py 1000000 Collatz.table
+    % python BuildCollatz.py -e bin 1000 Collatz.table
+
+To build it by growing the inverse tree from 1 instead
+of walking forward from every number (see collatz_tree_fill)
+    % python BuildCollatz.py -T 100000000 Collatz.table
+
+To use the table
+    % python RunCollatz.py -t Collatz.table < RunCollatz.in > RunCollatz.out
+
+To find the record holders in 1..N (Collatz.py loads
+Collatz.records from its own directory on import)
+    % python BuildCollatz.py -r 1000000000 Collatz.records
+
+To generate the single file SphereCollatz.py from Collatz.py, with
+the max cycle length of every block of 100 numbers in 1..N built in
+    % python BuildCollatz.py -s 1000000 SphereCollatz.py
+    % python BuildCollatz.py -s -k 500 1000000 SphereCollatz.py
+"""
+
+# -------
+# imports
+# -------
+
+import argparse
+
+from Collatz import collatz_build_table, collatz_build_records, collatz_build_sphere, SPHERE_BLOCK
+
+# ----
+# main
+# ----
+
+parser = argparse.ArgumentParser(description="build a cycle length table")
+parser.add_argument("size", type=int, help="highest number in the table")
+parser.add_argument("path", help="table file to write")
+parser.add_argument("-e", "--engine", help="cycle length engine")
+parser.add_argument("-T", "--tree", action="store_true", help="grow the inverse tree from 1 instead")
+parser.add_argument("-r", "--records", action="store_true", help="write the record holders instead")
+parser.add_argument("-s", "--sphere", action="store_true", help="write SphereCollatz.py instead")
+parser.add_argument("-k", "--block", type=int, default=SPHERE_BLOCK, help="numbers per block for -s")
+args = parser.parse_args()
+
+w = open(args.path, "wb")
+try :
+    if args.records :
+        collatz_build_records(w, args.size, args.engine)
+    elif args.sphere :
+        collatz_build_sphere(w, args.size + 1, args.block, args.engine)
+    else :
+        collatz_build_table(w, args.size, args.engine, args.tree)
+finally :
+    w.close()
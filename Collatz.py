@@ -10,7 +10,14 @@
 # collatz_read
 # ------------
 
-import sys, math
+import base64, bisect, itertools, sys, math, mmap, multiprocessing, multiprocessing.pool, os, re, socket, struct, threading, time, zlib
+import SocketServer
+from array import array
+
+try :
+    import numpy
+except ImportError :
+    numpy = None
 
 def collatz_read (r, a) :
     """
@@ -29,6 +36,161 @@ def collatz_read (r, a) :
     assert a[1] > 0
     return True
 
+# bytes per read of collatz_read_all, and
+# lines per write of collatz_print_all
+READ_CHUNK  = 1 << 20
+WRITE_LINES = 1 << 14
+
+def collatz_read_all (r, chunk=READ_CHUNK) :
+    """
+    reads every pair of ints in r, chunk bytes at a time
+    r is a reader
+    return a list of (i, j) pairs
+    raises ValueError naming the line if a line
+    is not two positive ints
+    """
+    pairs = []
+    tail = ""
+    line_no = 0
+    while True :
+        s = r.read(chunk)
+        if s == "" :
+            break
+        s = tail + s
+        cut = s.rfind("\n") + 1
+        tail = s[cut:]
+        line_no = collatz_parse(s[:cut], line_no, pairs)
+    if tail :
+        collatz_parse(tail, line_no, pairs)
+    return pairs
+
+# a line of the fast path of collatz_parse: two
+# unsigned ints between spaces or tabs
+PARSE_LINE = re.compile(r"^[ \t]*([0-9]+)[ \t]+([0-9]+)[ \t]*\r?$", re.M)
+
+def collatz_parse (s, line_no, pairs) :
+    """
+    parses whole lines of two ints each into pairs
+    s is a string of whole lines
+    line_no is the number of lines before s
+    pairs is a list the (i, j) pairs are appended to
+    return line_no plus the lines in s
+    """
+    lines = s.splitlines()
+
+    # fast path: every line matched in one go,
+    # good as long as every line is two ints
+    fields = PARSE_LINE.findall(s)
+    if len(fields) == len(lines) :
+        nums = map(int, itertools.chain.from_iterable(fields))
+        if not nums or min(nums) > 0 :
+            i = iter(nums)
+            pairs.extend(zip(i, i))
+            return line_no + len(lines)
+
+    # slow path: find the bad line
+    for k, line in enumerate(lines) :
+        l = line.split()
+        try :
+            if len(l) != 2 :
+                raise ValueError
+            i, j = int(l[0]), int(l[1])
+        except ValueError :
+            raise ValueError("line %d: expected two ints, got %r" % (line_no + k + 1, line))
+        if i <= 0 or j <= 0 :
+            raise ValueError("line %d: expected positive ints, got %r" % (line_no + k + 1, line))
+        pairs.append((i, j))
+    return line_no + len(lines)
+
+# binary queries and results, for collatz_solve and for
+# producers that would rather not print and parse text:
+# a little endian header (magic, version) followed by
+# fixed width records, two uint64s i and j per query,
+# and i, j and a uint32 v per result
+WIRE_QUERY_MAGIC  = "CLTQ"
+WIRE_RESULT_MAGIC = "CLTA"
+WIRE_VERSION      = 1
+WIRE_HEADER       = struct.Struct("<4sH")
+WIRE_QUERY        = struct.Struct("<QQ")
+WIRE_RESULT       = struct.Struct("<QQI")
+
+def wire_records (data, magic, record) :
+    """
+    checks the header of binary queries or results
+    data is a buffer: a string, a memoryview or an mmap
+    magic is WIRE_QUERY_MAGIC or WIRE_RESULT_MAGIC
+    record is WIRE_QUERY or WIRE_RESULT
+    return the offsets of the records
+    raises ValueError if data is not that kind of
+    file, is another version or is cut short
+    """
+    if len(data) < WIRE_HEADER.size or WIRE_HEADER.unpack_from(data)[0] != magic :
+        raise ValueError("not binary collatz data: expected %r" % magic)
+    version = WIRE_HEADER.unpack_from(data)[1]
+    if version != WIRE_VERSION :
+        raise ValueError("unsupported binary collatz version %d" % version)
+    if (len(data) - WIRE_HEADER.size) % record.size :
+        raise ValueError("truncated binary collatz data")
+    return xrange(WIRE_HEADER.size, len(data), record.size)
+
+def collatz_read_binary (data) :
+    """
+    reads binary queries in place, without copying
+    data is a buffer: a string, a memoryview or an mmap
+    yields every (i, j) pair
+    raises ValueError on a record with a 0
+    """
+    unpack = WIRE_QUERY.unpack_from
+    for offset in wire_records(data, WIRE_QUERY_MAGIC, WIRE_QUERY) :
+        i, j = unpack(data, offset)
+        if not i or not j :
+            raise ValueError("record %d: expected positive ints, got %d %d"
+                             % ((offset - WIRE_HEADER.size) // WIRE_QUERY.size, i, j))
+        yield i, j
+
+def collatz_read_results (data) :
+    """
+    reads binary results in place, without copying
+    data is a buffer: a string, a memoryview or an mmap
+    yields every (i, j, v)
+    """
+    unpack = WIRE_RESULT.unpack_from
+    for offset in wire_records(data, WIRE_RESULT_MAGIC, WIRE_RESULT) :
+        yield unpack(data, offset)
+
+class PrefixReader (object) :
+    """
+    A reader that returns prefix before the rest of r,
+    for readers that cannot seek back after a peek.
+    """
+
+    def __init__ (self, prefix, r) :
+        self.prefix = prefix
+        self.r      = r
+
+    def readline (self) :
+        prefix = self.prefix
+        if not prefix :
+            return self.r.readline()
+        k = prefix.find("\n") + 1
+        if k :
+            self.prefix = prefix[k:]
+            return prefix[:k]
+        self.prefix = ""
+        return prefix + self.r.readline()
+
+    def read (self, size=-1) :
+        prefix = self.prefix
+        if not prefix :
+            return self.r.read(size)
+        self.prefix = ""
+        if size < 0 :
+            return prefix + self.r.read()
+        if size <= len(prefix) :
+            self.prefix = prefix[size:]
+            return prefix[:size]
+        return prefix + self.r.read(size - len(prefix))
+
 # ------------
 # collatz_eval
 # ------------
@@ -46,7 +208,910 @@ def collatz_read (r, a) :
 # the highest number in its cycle of all
 # starting values is 704511; going to 56991483520
 MAX_RANGE = 1000000
-cycle_list = [None]*MAX_RANGE
+
+# range_max scans the cache this many
+# entries at a time so a query never
+# copies more than one small block
+RANGE_MAX_CHUNK = 4096
+
+# default number of entries the high tier keeps
+# for numbers past the end of the cache, and the
+# number below which it also keeps trajectory values;
+# trajectory values past MAX_RANGE hit about 1% of the
+# time on 2000000..2300000, so by default only the
+# starting values queries ask for are kept
+HIGH_LIMIT = 1 << 20
+HIGH_BOUND = MAX_RANGE
+
+class HighCache (object) :
+    """
+    A bounded cache of cycle lengths for numbers too big
+    for the cycle table. It keeps every starting value past
+    the table that collatz_fill computes, and the numbers
+    trajectories pass through below <bound> (higher ones
+    are rarely seen twice). New entries go into a young
+    generation; once it holds limit/2 entries the old
+    generation is dropped and the young one takes its
+    place. A hit in the old generation moves the entry
+    back to the young one, so this evicts roughly least
+    recently used. A lock keeps the two generations
+    consistent across threads.
+    """
+
+    def __init__ (self, limit=HIGH_LIMIT, bound=HIGH_BOUND) :
+        assert limit > 1
+        self.limit     = limit
+        self.bound     = bound
+        self.young     = {}
+        self.old       = {}
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+        self.lock      = threading.Lock()
+
+    def __len__ (self) :
+        return len(self.young) + len(self.old)
+
+    def get (self, n) :
+        """
+        Takes in an integer, returns its cached
+        cycle length or 0 if it is not cached.
+        """
+        with self.lock :
+            cycle = self.young.get(n)
+            if cycle is None :
+                cycle = self.old.get(n)
+                if cycle is None :
+                    self.misses += 1
+                    return 0
+                del self.old[n]
+                self.store(n, cycle)
+            self.hits += 1
+            return cycle
+
+    def put (self, n, cycle) :
+        """
+        Caches the cycle length of a number seen
+        on a trajectory, if it is below the bound.
+        """
+        if n < self.bound :
+            self.keep(n, cycle)
+
+    def keep (self, n, cycle) :
+        """
+        Caches the cycle length of n, dropping
+        the old generation if the young one is full.
+        """
+        with self.lock :
+            self.store(n, cycle)
+
+    def store (self, n, cycle) :
+        """
+        keep, with the lock already held
+        """
+        young = self.young
+        young[n] = cycle
+        if len(young) >= self.limit // 2 :
+            self.evictions += len(self.old)
+            self.old   = young
+            self.young = {}
+
+    def stats (self) :
+        """
+        Returns a dict of the entries, limit,
+        hits, misses and evictions so far.
+        """
+        return {"entries"   : len(self),
+                "limit"     : self.limit,
+                "hits"      : self.hits,
+                "misses"    : self.misses,
+                "evictions" : self.evictions}
+
+class CycleCache (object) :
+    """
+    A lazy cache of cycle lengths for 0 <= n < size.
+
+    Entries are unsigned 16 bit ints (2 bytes each
+    instead of a pointer and an int object per slot);
+    0 marks a number whose cycle is not computed yet.
+    Numbers past the end go to the high tier, if any.
+
+    Threads share it without locks: an entry is one
+    aligned 2 byte store, and every thread that writes
+    it writes the same cycle length, so a reader sees
+    0 or the right value and a race only repeats work.
+    """
+
+    def __init__ (self, size, high=None) :
+        self.size  = size
+        self.table = array("H", [0]) * size
+        self.high  = high
+
+    def __len__ (self) :
+        return self.size
+
+    def __getitem__ (self, n) :
+        return self.table[n]
+
+    def __setitem__ (self, n, cycle) :
+        self.table[n] = cycle
+
+    def get (self, n) :
+        """
+        Takes in an integer, returns its cached
+        cycle length or 0 if it is not cached.
+        """
+        if n < self.size :
+            return self.table[n]
+
+        # trajectories only look in the high
+        # tier below the bound it keeps them for
+        high = self.high
+        if high is not None and n < high.bound :
+            return high.get(n)
+        return 0
+
+    def put (self, n, cycle) :
+        """
+        Caches the cycle length of n if n is
+        inside the cache and not cached yet,
+        or in the high tier if n is past the end.
+        """
+        if n < self.size :
+            if not self.table[n] :
+                self.table[n] = cycle
+        elif self.high is not None and n < self.high.bound :
+            self.high.keep(n, cycle)
+
+    def recall (self, n) :
+        """
+        Takes in a number a query asked for, returns
+        its cached cycle length or 0; like get, but past
+        the end it always looks in the high tier.
+        """
+        if n < self.size :
+            return self.table[n]
+        if self.high is not None :
+            return self.high.get(n)
+        return 0
+
+    def keep (self, n, cycle) :
+        """
+        Caches the cycle length of a number a query
+        asked for; like put, but past the end it
+        always goes into the high tier.
+        """
+        if n < self.size :
+            self.put(n, cycle)
+        elif self.high is not None :
+            self.high.keep(n, cycle)
+
+    def range_max (self, lower, upper) :
+        """
+        Takes in two integers, returns the max cached
+        cycle length in [lower, upper] without
+        copying the whole range.
+        """
+        assert 0 <= lower <= upper < self.size
+        table = self.table
+        max_cycle = 0
+        for start in xrange(lower, upper + 1, RANGE_MAX_CHUNK) :
+            end = min(start + RANGE_MAX_CHUNK, upper + 1)
+            block_max = max(table[start:end])
+            if block_max > max_cycle :
+                max_cycle = block_max
+        return max_cycle
+
+    def filled (self, lower, upper) :
+        """
+        Takes in two integers, returns True if every
+        number in [lower, upper] is cached.
+        """
+        return upper < self.size and not self.table[lower:upper + 1].count(0)
+
+# precomputed tables written by collatz_build_table:
+# a little endian header (magic, version, bytes per
+# entry, number of entries, crc32 of the entries)
+# followed by one uint16 cycle length per number
+# starting from 0 (whose entry is always 0)
+TABLE_MAGIC   = "CLTZ"
+TABLE_VERSION = 1
+TABLE_HEADER  = struct.Struct("<4sHHQI")
+
+class MappedCycleCache (object) :
+    """
+    A read-only cache of cycle lengths memory-mapped
+    from a table file, so every process shares the
+    same pages. Numbers past the end of the table fall
+    back to the live cache (if any) and the engine.
+    """
+
+    def __init__ (self, path, live=None, verify=True) :
+        f = open(path, "rb")
+        try :
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        finally :
+            f.close()
+        magic, version, width, count, crc = TABLE_HEADER.unpack_from(self.map)
+        if magic != TABLE_MAGIC :
+            raise ValueError("not a cycle table: %s" % path)
+        if version != TABLE_VERSION or width != 2 :
+            raise ValueError("unsupported cycle table version %d: %s" % (version, path))
+        if len(self.map) != TABLE_HEADER.size + 2 * count :
+            raise ValueError("truncated cycle table: %s" % path)
+        if verify and table_checksum(self.map, TABLE_HEADER.size) != crc :
+            raise ValueError("cycle table checksum mismatch: %s" % path)
+        self.size   = count
+        self.live   = live
+        self.evicts = getattr(live, "evicts", False)
+
+    def __len__ (self) :
+        if self.live is not None :
+            return max(self.size, len(self.live))
+        return self.size
+
+    def __getitem__ (self, n) :
+        return self.get(n)
+
+    def get (self, n) :
+        """
+        Takes in an integer, returns its cycle length
+        from the table, the live cache, or 0.
+        """
+        if n < self.size :
+            return struct.unpack_from("<H", self.map, TABLE_HEADER.size + 2 * n)[0]
+        if self.live is not None :
+            return self.live.get(n)
+        return 0
+
+    def put (self, n, cycle) :
+        """
+        Caches the cycle length of n in the live
+        cache; the mapped table is read-only.
+        """
+        if n >= self.size and self.live is not None :
+            self.live.put(n, cycle)
+
+    def recall (self, n) :
+        """
+        Takes in a number a query asked for, returns its
+        cycle length from the table or the live cache
+        (see CycleCache.recall), or 0.
+        """
+        if n < self.size :
+            return self.get(n)
+        if self.live is not None :
+            return self.live.recall(n)
+        return 0
+
+    def keep (self, n, cycle) :
+        """
+        Caches the cycle length of a number a query
+        asked for in the live cache (see CycleCache.keep).
+        """
+        if n >= self.size and self.live is not None :
+            self.live.keep(n, cycle)
+
+    def range_max (self, lower, upper) :
+        """
+        Takes in two integers, returns the max cached
+        cycle length in [lower, upper] without
+        copying the whole range.
+        """
+        assert 0 <= lower <= upper < len(self)
+        max_cycle = 0
+        offset = TABLE_HEADER.size
+        for start in xrange(lower, min(upper + 1, self.size), RANGE_MAX_CHUNK) :
+            end = min(start + RANGE_MAX_CHUNK, upper + 1, self.size)
+            block = array("H", self.map[offset + 2 * start:offset + 2 * end])
+            if sys.byteorder != "little" :
+                block.byteswap()
+            max_cycle = max(max_cycle, max(block))
+        if upper >= self.size :
+            max_cycle = max(max_cycle, self.live.range_max(max(lower, self.size), upper))
+        return max_cycle
+
+    def filled (self, lower, upper) :
+        """
+        Takes in two integers, returns True if every
+        number in [lower, upper] is cached.
+        """
+        if upper < self.size :
+            return True
+        return self.live is not None and self.live.filled(max(lower, self.size), upper)
+
+def table_checksum (data, offset) :
+    """
+    Takes in a buffer and an offset, returns the crc32
+    of everything past the offset as an unsigned int.
+    """
+    crc = 0
+    for start in xrange(offset, len(data), 1 << 20) :
+        crc = zlib.crc32(data[start:start + (1 << 20)], crc)
+    return crc & 0xffffffff
+
+cycle_list = CycleCache(MAX_RANGE, HighCache(HIGH_LIMIT))
+
+def collatz_high_cache (limit=HIGH_LIMIT, bound=HIGH_BOUND) :
+    """
+    replaces the high tier of the cycle cache
+    limit is the entries it keeps, 0 turns it off
+    bound is the number below which it keeps trajectory values
+    return the new high tier or None
+    """
+    cache = cycle_list
+    if isinstance(cache, MappedCycleCache) :
+        cache = cache.live
+    if cache is None :
+        return None
+    cache.high = None
+    if limit :
+        cache.high = HighCache(limit, bound)
+    return cache.high
+
+# numbers per segment of a BudgetCache (128 KB of
+# cycle lengths), its eviction policies, and the share
+# of its segments the "slru" policy keeps protected
+BUDGET_SEGMENT   = 1 << 16
+BUDGET_POLICIES  = ("lru", "lfu", "slru")
+BUDGET_PROTECTED = 0.8
+
+class BudgetCache (object) :
+    """
+    A cache of cycle lengths for 0 <= n < size that keeps
+    inside a budget of <budget> bytes. The numbers below
+    <dense> (where every trajectory ends) are one array
+    that is never evicted; past it the cache is split into
+    segments of <segment> numbers, each a dense array made
+    the first time a query keeps a number in it, so hot
+    ranges are dense and cold ones take no memory. Once the
+    budget is spent a new segment evicts a resident one:
+        lru  - the one queries touched least recently
+        lfu  - the one queries touched least often
+        slru - segmented lru: a segment touched again after
+               it came in is protected, and unprotected
+               segments are evicted first
+    Trajectory values (put) only make a segment resident
+    while the budget has room for it.
+
+    A range can lose its first segments before its last
+    ones are filled, so collatz_fill tracks the max of every
+    number it sees in a cache that evicts. Segments come and
+    go under a lock; reads take none, so the hit and miss
+    counts are approximate across threads.
+    """
+
+    evicts = True
+
+    def __init__ (self, size=None, budget=1 << 24, policy="lru", segment=BUDGET_SEGMENT, dense=None, high=None) :
+        assert policy in BUDGET_POLICIES
+        assert segment > 0 and not segment & (segment - 1)
+        if dense is None :
+            dense = segment
+        if size is None :
+            size = max(MAX_RANGE, budget // 2 - budget // 2 % segment)
+        dense = min(dense, size)
+        self.capacity = (budget - 2 * dense) // (2 * segment)
+        assert self.capacity >= 2, "budget too small"
+        self.size      = size
+        self.budget    = budget
+        self.policy    = policy
+        self.segment   = segment
+        self.shift     = segment.bit_length() - 1
+        self.mask      = segment - 1
+        self.dense     = dense
+        self.low       = array("H", [0]) * dense
+        self.segments  = {}
+        self.stamps    = {}
+        self.counts    = {}
+        self.protected = set()
+        self.clock     = 0
+        self.touched   = None
+        self.last      = None
+        self.hits      = 0
+        self.misses    = 0
+        self.evictions = 0
+        self.high      = high
+        self.lock      = threading.Lock()
+
+    def __len__ (self) :
+        return self.size
+
+    def get (self, n) :
+        """
+        Takes in an integer, returns its cached
+        cycle length or 0 if it is not cached.
+        """
+        if n < self.dense :
+            return self.low[n]
+        if n < self.size :
+            segment = self.segments.get(n >> self.shift)
+            if segment is not None :
+                return segment[n & self.mask]
+            return 0
+        high = self.high
+        if high is not None and n < high.bound :
+            return high.get(n)
+        return 0
+
+    def put (self, n, cycle) :
+        """
+        Caches the cycle length of a number seen on a
+        trajectory if its segment is resident or the budget
+        has room for it, or in the high tier if n is past
+        the end; it never evicts a segment.
+        """
+        if n < self.dense :
+            self.low[n] = cycle
+        elif n < self.size :
+            segment = self.segments.get(n >> self.shift)
+            if segment is None and len(self.segments) < self.capacity :
+                segment = self.admit(n >> self.shift)
+            if segment is not None :
+                segment[n & self.mask] = cycle
+        elif self.high is not None and n < self.high.bound :
+            self.high.keep(n, cycle)
+
+    def recall (self, n) :
+        """
+        Takes in a number a query asked for, returns its
+        cached cycle length or 0 and counts a hit or a
+        miss; past the end it looks in the high tier.
+        """
+        if n >= self.size :
+            return self.high.get(n) if self.high is not None else 0
+        if n < self.dense :
+            cycle = self.low[n]
+        else :
+            k = n >> self.shift
+            if k != self.touched :
+                self.touch(k)
+            segment = self.segments.get(k)
+            cycle = segment[n & self.mask] if segment is not None else 0
+        if cycle :
+            self.hits += 1
+        else :
+            self.misses += 1
+        return cycle
+
+    def keep (self, n, cycle) :
+        """
+        Caches the cycle length of a number a query asked
+        for, making its segment resident if it is not;
+        past the end it goes into the high tier.
+        """
+        if n >= self.size :
+            if self.high is not None :
+                self.high.keep(n, cycle)
+        elif n < self.dense :
+            self.low[n] = cycle
+        else :
+            k = n >> self.shift
+            segment = self.segments.get(k)
+            if segment is None :
+                segment = self.admit(k)
+            elif k != self.touched :
+                self.touch(k)
+            segment[n & self.mask] = cycle
+
+    def touch (self, k) :
+        """
+        counts a query touching segment k, if it is resident
+        """
+        with self.lock :
+            self.touched = k
+            if k in self.segments :
+                self.mark(k)
+
+    def mark (self, k) :
+        """
+        touch, with the lock held
+        """
+        self.clock    += 1
+        self.touched   = k
+        self.last      = k
+        self.stamps[k] = self.clock
+        self.counts[k] += 1
+        protected = self.protected
+        if self.policy == "slru" and k not in protected and self.counts[k] > 1 :
+            protected.add(k)
+            if len(protected) > int(self.capacity * BUDGET_PROTECTED) :
+                protected.remove(min(protected, key=self.stamps.get))
+
+    def admit (self, k) :
+        """
+        makes segment k resident, evicting one
+        if the budget is spent; return the segment
+        """
+        with self.lock :
+            segment = self.segments.get(k)
+            if segment is None :
+                if len(self.segments) >= self.capacity :
+                    self.evict()
+                segment = array("H", [0]) * self.segment
+                self.segments[k] = segment
+                self.counts[k]   = 0
+            self.mark(k)
+            return segment
+
+    def evict (self) :
+        """
+        drops the segment the policy picks, never the
+        last one touched, with the lock held
+        """
+        candidates = [k for k in self.segments if k != self.last]
+        if self.policy == "lfu" :
+            victim = min(candidates, key=lambda k : (self.counts[k], self.stamps[k]))
+        else :
+            if self.policy == "slru" :
+                candidates = [k for k in candidates if k not in self.protected] or candidates
+            victim = min(candidates, key=self.stamps.get)
+        del self.segments[victim], self.stamps[victim], self.counts[victim]
+        self.protected.discard(victim)
+        self.evictions += 1
+
+    def blocks (self, lower, upper) :
+        """
+        Takes in two integers, yields (array, start, end)
+        for every resident slice of [lower, upper], with
+        start and end indices into the array; touches
+        every segment it yields from.
+        """
+        if lower < self.dense :
+            yield self.low, lower, min(upper + 1, self.dense)
+            lower = self.dense
+        for k in xrange(lower >> self.shift, (upper >> self.shift) + 1) :
+            segment = self.segments.get(k)
+            if segment is not None :
+                if k != self.touched :
+                    self.touch(k)
+                base = k << self.shift
+                yield segment, max(lower, base) - base, min(upper + 1, base + self.segment) - base
+
+    def range_max (self, lower, upper) :
+        """
+        Takes in two integers, returns the max cached
+        cycle length in [lower, upper] without
+        copying the whole range.
+        """
+        assert 0 <= lower <= upper < self.size
+        max_cycle = 0
+        for table, start, end in self.blocks(lower, upper) :
+            for chunk in xrange(start, end, RANGE_MAX_CHUNK) :
+                block_max = max(table[chunk:min(chunk + RANGE_MAX_CHUNK, end)])
+                if block_max > max_cycle :
+                    max_cycle = block_max
+        return max_cycle
+
+    def filled (self, lower, upper) :
+        """
+        Takes in two integers, returns True if every
+        number in [lower, upper] is cached.
+        """
+        if upper >= self.size :
+            return False
+        count = 0
+        for table, start, end in self.blocks(lower, upper) :
+            if table[start:end].count(0) :
+                return False
+            count += end - start
+        return count == upper - lower + 1
+
+    def stats (self) :
+        """
+        Returns a dict of the budget, the bytes in use and
+        their share of it (occupancy), the resident segments
+        and how many fit, the cached entries, and the hits,
+        misses, hit rate and evictions so far.
+        """
+        with self.lock :
+            segments = self.segments.values()
+        used    = 2 * (self.dense + self.segment * len(segments))
+        entries = self.dense - self.low.count(0) + sum(self.segment - s.count(0) for s in segments)
+        lookups = self.hits + self.misses
+        return {"budget"    : self.budget,
+                "bytes"     : used,
+                "occupancy" : float(used) / self.budget,
+                "segments"  : len(segments),
+                "capacity"  : self.capacity,
+                "entries"   : entries,
+                "hits"      : self.hits,
+                "misses"    : self.misses,
+                "hit_rate"  : float(self.hits) / lookups if lookups else 0.0,
+                "evictions" : self.evictions}
+
+def collatz_cache_budget (budget, policy="lru", size=None, segment=BUDGET_SEGMENT, dense=None) :
+    """
+    replaces the cycle cache (the live cache under a
+    mapped table) with a BudgetCache, keeping its high tier
+    budget is the bytes the cache may use
+    policy is a name in BUDGET_POLICIES
+    size is where the cache ends, None for as many
+    numbers as the budget holds (at least MAX_RANGE)
+    segment is the numbers per segment, a power of 2
+    dense is the numbers from 0 never evicted, one segment if None
+    return the new cache
+    """
+    global cycle_list, range_index
+    mapped = cycle_list if isinstance(cycle_list, MappedCycleCache) else None
+    old = mapped.live if mapped is not None else cycle_list
+    cache = BudgetCache(size, budget, policy, segment, dense, getattr(old, "high", None))
+    if mapped is not None :
+        mapped.live   = cache
+        mapped.evicts = True
+    else :
+        cycle_list = cache
+        if range_index is not None :
+            range_index = RangeMaxIndex(cycle_list, range_index.block)
+    return cache
+
+# default numbers per block of the range-max index;
+# the index costs 2 bytes per block on top of the cache
+RANGE_INDEX_BLOCK = 1024
+
+class RangeMaxIndex (object) :
+    """
+    A block decomposition over a cycle cache: the max of
+    every block of <block> numbers is stored the first
+    time a query covers the whole block, so later queries
+    read whole blocks from the index and only scan the
+    partial blocks at either end of the range.
+
+    cache has to be the module cycle_list, since
+    that is the cache the engines fill.
+    """
+
+    def __init__ (self, cache, block=RANGE_INDEX_BLOCK) :
+        assert block > 0
+        self.cache  = cache
+        self.block  = block
+        self.maxima = array("H", [0]) * (len(cache) // block)
+
+    def range_max (self, funct_collatz, lower, upper) :
+        """
+        Takes in an engine and two integers, fills whatever
+        part of [lower, upper] is not indexed yet and
+        returns the max cycle length in the range.
+        """
+        assert 0 < lower <= upper < len(self.cache)
+        cache  = self.cache
+        block  = self.block
+        maxima = self.maxima
+        first  = (lower + block - 1) // block
+        last   = min((upper + 1) // block, len(maxima))
+
+        # the range does not cover a whole block
+        if first >= last :
+            return max(collatz_fill(funct_collatz, lower, upper), cache.range_max(lower, upper))
+
+        # partial blocks at either end
+        max_cycle = 0
+        if lower < first * block :
+            max_cycle = max(collatz_fill(funct_collatz, lower, first * block - 1),
+                            cache.range_max(lower, first * block - 1))
+        if last * block <= upper :
+            max_cycle = max(max_cycle, collatz_fill(funct_collatz, last * block, upper),
+                            cache.range_max(last * block, upper))
+
+        # whole blocks, building the ones not indexed yet
+        if not min(maxima[first:last]) :
+            for k in xrange(first, last) :
+                if not maxima[k] :
+                    start = k * block
+                    maxima[k] = max(collatz_fill(funct_collatz, start, start + block - 1),
+                                    cache.range_max(start, start + block - 1))
+        return max(max_cycle, max(maxima[first:last]))
+
+# the range-max index max_collatz answers from,
+# None unless turned on with collatz_range_index
+range_index = None
+
+def collatz_range_index (block=RANGE_INDEX_BLOCK) :
+    """
+    turns on the range-max index over the cycle cache
+    block is the numbers per index entry, None turns it off
+    """
+    global range_index
+    if block is None :
+        range_index = None
+    else :
+        range_index = RangeMaxIndex(cycle_list, block)
+
+# default numbers per chunk handed to a worker, and
+# the smallest range worth sending to the pool at all
+POOL_CHUNK     = 1 << 16
+POOL_MIN_RANGE = 1 << 17
+
+class WorkerPool (object) :
+    """
+    A process pool that splits big ranges into chunks.
+    Each worker fills its chunk in its own copy of the
+    cycle cache and sends back the chunk's max and its
+    cycle lengths, which are folded into this process's
+    cache. Chunks already cached here are not sent.
+    """
+
+    def __init__ (self, workers=None, chunk=POOL_CHUNK, min_range=POOL_MIN_RANGE) :
+        assert chunk > 0
+        self.workers   = workers
+        self.chunk     = chunk
+        self.min_range = min_range
+        self.pool      = multiprocessing.Pool(workers, pool_init)
+
+    def range_max (self, funct_collatz, lower, upper) :
+        """
+        Takes in an engine and two integers, fills
+        [lower, upper] across the pool and returns
+        the max cycle length in the range.
+        """
+        assert 0 < lower <= upper
+        table = getattr(cycle_list, "table", None)
+        max_cycle = 0
+        jobs = []
+        start = lower
+        while start <= upper :
+            end = min(start + self.chunk - 1, upper)
+            if cycle_list.filled(start, end) :
+                max_cycle = max(max_cycle, cycle_list.range_max(start, end))
+            else :
+                jobs.append((funct_collatz, start, end))
+            start = end + 1
+
+        for start, chunk_max, cycles in self.pool.imap_unordered(pool_chunk, jobs) :
+            max_cycle = max(max_cycle, chunk_max)
+            if cycles is not None and table is not None :
+                table[start:start + len(cycles)] = cycles
+        return max_cycle
+
+    def close (self) :
+        self.pool.terminate()
+        self.pool.join()
+
+def pool_init () :
+    """
+    Runs once in every worker: workers
+    never hand ranges to a pool themselves.
+    """
+    global worker_pool
+    worker_pool = None
+
+def pool_chunk (job) :
+    """
+    Runs in a worker: fills one chunk and returns its
+    start, its max cycle length and its cycle lengths
+    inside the cache (or None).
+    """
+    funct_collatz, lower, upper = job
+    max_cycle = collatz_fill(funct_collatz, lower, upper)
+    size = len(cycle_list)
+    cycles = None
+    if lower < size :
+        top = min(upper, size - 1)
+        max_cycle = max(max_cycle, cycle_list.range_max(lower, top))
+        table = getattr(cycle_list, "table", None)
+        if table is not None :
+            cycles = table[lower:top + 1]
+    return lower, max_cycle, cycles
+
+# the process pool max_collatz splits big
+# ranges across, None unless turned on
+# with collatz_workers
+worker_pool = None
+
+def collatz_workers (workers=None, chunk=POOL_CHUNK, min_range=POOL_MIN_RANGE) :
+    """
+    starts a process pool for big ranges
+    workers is the number of processes, all cores if None,
+    0 stops the pool
+    chunk is the numbers per worker task
+    min_range is the smallest range sent to the pool
+    """
+    global worker_pool
+    if worker_pool is not None :
+        worker_pool.close()
+        worker_pool = None
+    if workers != 0 :
+        worker_pool = WorkerPool(workers, chunk, min_range)
+
+# default seconds a query takes before
+# collatz_eval counts it as slow
+SLOW_QUERY = 0.1
+
+class CollatzStats (object) :
+    """
+    Counters and timers kept by the evaluator while they
+    are turned on with collatz_metrics. Numbers filled by
+    the worker pool are counted in the workers, not here;
+    the counters are not locked, so queries on many
+    threads at once can lose a few counts.
+    """
+
+    FIELDS = (
+        "queries",          # collatz_eval calls
+        "query_seconds",    # wall time of all of them
+        "query_max",        # wall time of the slowest one
+        "slow_queries",     # queries at or past slow seconds
+        "result_hits",      # queries answered by the result cache
+        "clamped",          # ranges cut to [upper/2, upper]
+        "clamped_numbers",  # numbers the cut skipped
+        "meta_hits",        # ranges answered by check_meta
+        "pool_ranges",      # ranges split across the worker pool
+        "index_ranges",     # ranges answered by the range-max index
+        "bulk_fills",       # ranges filled by an engine's bulk fill
+        "cache_hits",       # numbers of a range already in the cache
+        "cache_misses",     # numbers of a range an engine computed
+        "pruned",           # numbers of a range pruned by collatz_fill
+        "engine_calls",     # calls to bin_collatz, int_collatz, jump_collatz
+        "engine_steps",     # steps they took
+        "engine_cached")    # calls that stopped at a cached number
+
+    def __init__ (self, slow=SLOW_QUERY, log=None) :
+        self.slow = slow
+        self.log  = log
+        self.reset()
+
+    def reset (self) :
+        """
+        sets every counter back to 0
+        """
+        for name in self.FIELDS :
+            setattr(self, name, 0)
+
+    def snapshot (self) :
+        """
+        return a dict of every counter
+        """
+        return dict((name, getattr(self, name)) for name in self.FIELDS)
+
+    def engine (self, steps, cached) :
+        """
+        counts one engine call of steps steps
+        """
+        self.engine_calls += 1
+        self.engine_steps += steps
+        if cached :
+            self.engine_cached += 1
+
+    def query (self, i, j, v, seconds) :
+        """
+        counts one query and logs it if it is slow
+        """
+        self.queries       += 1
+        self.query_seconds += seconds
+        if seconds > self.query_max :
+            self.query_max = seconds
+        if self.slow is not None and seconds >= self.slow :
+            self.slow_queries += 1
+            if self.log is not None :
+                self.log.write("slow query %d %d %d %.6f\n" % (i, j, v, seconds))
+
+# the counters the evaluator keeps, None unless turned
+# on with collatz_metrics; while None every counter
+# costs one global lookup per query or engine call
+collatz_stats = None
+
+def collatz_metrics (on=True, slow=SLOW_QUERY, log=None) :
+    """
+    turns on the evaluator's counters and timers
+    on is False to turn them off
+    slow is the seconds a query takes to count as slow
+    log is a writer slow queries are written to, or None
+    return the new counters or None
+    """
+    global collatz_stats
+    collatz_stats = None
+    if on :
+        collatz_stats = CollatzStats(slow, log)
+    return collatz_stats
+
+def collatz_snapshot () :
+    """
+    return a dict of the evaluator's counters,
+    empty while they are off
+    """
+    if collatz_stats is None :
+        return {}
+    return collatz_stats.snapshot()
 
 # meta cache dictionary holding the sequence
 # keys correspond to the sequence here: http://oeis.org/A006877
@@ -74,6 +1139,52 @@ META_DICT = {
 # sorted keys of the meta data
 META_KEYS = sorted(META_DICT.keys())
 
+# every record holder up to here is in the meta data
+# (the next one is 1117065); past it a range could hold
+# a record holder nobody knows about
+META_LIMIT = 1117064
+
+# the record holder file written by collatz_build_records
+# extends the meta data: a little endian header (magic,
+# version, number of records, highest number searched)
+# followed by a uint64 number and a uint16 cycle length
+# per record holder, in order
+RECORD_MAGIC   = "CLTR"
+RECORD_VERSION = 1
+RECORD_HEADER  = struct.Struct("<4sHIQ")
+RECORD_ENTRY   = struct.Struct("<QH")
+RECORD_FILE    = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Collatz.records")
+
+def collatz_load_records (path) :
+    """
+    replaces the meta data with a file
+    written by collatz_build_records
+    path is the record holder file
+    """
+    global META_DICT, META_KEYS, META_LIMIT
+    f = open(path, "rb")
+    try :
+        data = f.read()
+    finally :
+        f.close()
+    if len(data) < RECORD_HEADER.size :
+        raise ValueError("not a record holder file: %s" % path)
+    magic, version, count, limit = RECORD_HEADER.unpack_from(data)
+    if magic != RECORD_MAGIC :
+        raise ValueError("not a record holder file: %s" % path)
+    if version != RECORD_VERSION :
+        raise ValueError("unsupported record holder version %d: %s" % (version, path))
+    if len(data) != RECORD_HEADER.size + count * RECORD_ENTRY.size :
+        raise ValueError("truncated record holder file: %s" % path)
+    records = [RECORD_ENTRY.unpack_from(data, RECORD_HEADER.size + k * RECORD_ENTRY.size)
+               for k in xrange(count)]
+    META_DICT  = dict(records)
+    META_KEYS  = [n for n, cycle in records]
+    META_LIMIT = limit
+
+if os.path.exists(RECORD_FILE) :
+    collatz_load_records(RECORD_FILE)
+
 
 def do_bin (num):
     """
@@ -81,10 +1192,10 @@ def do_bin (num):
 
     Takes an integer, returns a string.
     """
-    if num == 0:
-        return '0'
-    else:
-        return (do_bin(num/2)+str(num%2)).lstrip('0') or '0'
+    # bin does it in one pass, where halving
+    # recursively took one call and one string
+    # copy per bit and hit the recursion limit
+    return bin(num)[2:]
 
 def bin_collatz (num):
     """
@@ -123,9 +1234,12 @@ def bin_collatz (num):
         # also keep a decimal form
         # to check if exists in the lazy cache
         n = int(bit_str, 2)
-        if n < MAX_RANGE and cycle_list[n] != None:
-            cycle_list[num] = cycle + cycle_list[n]
-            return cycle + cycle_list[n]
+        cached = cycle_list.get(n)
+        if cached:
+            cycle_list.put(num, cycle + cached)
+            if collatz_stats is not None:
+                collatz_stats.engine(cycle, cached)
+            return cycle + cached
 
         # for the computed number so far
         # append it to a list and increase the cycle
@@ -140,36 +1254,519 @@ def bin_collatz (num):
     # add all the values seen in the computation
     # into the lazy cache
     for x in range(0, len_num_seen):
-        if num_seen[x] < MAX_RANGE:
-            if cycle_list[num_seen[x]] == None:
-                cycle_list[num_seen[x]] = len_num_seen - x
+        cycle_list.put(num_seen[x], len_num_seen - x)
     assert cycle > 0
+    if collatz_stats is not None:
+        collatz_stats.engine(cycle - 1, 0)
 
     # finally return the computed cycle length
     return cycle
 
+def int_collatz (num):
+    """
+    Computes the cycle length of any
+    number via Collatz conjecture using
+    native integer operations only.
+
+    Takes in an integer, returns an integer.
+    """
+    assert num > 0
+    if num > BIG_LIMIT:
+        return big_collatz(num)
+    n = num
+    steps = 0
+    num_seen = []
+    cached = 0
+    get = cycle_list.get
+
+    # walk the sequence until it reaches 1
+    # or a number already in the lazy cache
+    while n != 1:
+        cached = get(n)
+        if cached:
+            break
+        num_seen.append((n, steps))
+
+        # odd case: 3n+1 is always even so
+        # take the (3n+1)/2 step in one go
+        if n & 1:
+            n = (n * 3 + 1) >> 1
+            steps += 2
+
+        # even case: strip all the trailing
+        # zeros with a single shift
+        else:
+            zeros = (n & -n).bit_length() - 1
+            n >>= zeros
+            steps += zeros
+
+    if cached:
+        cycle = steps + cached
+    else:
+        cycle = steps + 1
+
+    # add every number landed on into the lazy cache;
+    # each one is <steps> away from the start
+    put = cycle_list.put
+    for x, x_steps in num_seen:
+        put(x, cycle - x_steps)
+    assert cycle > 0
+    if collatz_stats is not None:
+        collatz_stats.engine(steps, cached)
+    return cycle
+
+# default k of jump_collatz: the steps it takes at once
+JUMP_BITS = 12
+
+def jump_build (bits):
+    """
+    Builds the jump table for k = bits: for every residue r
+    mod 2^k, n = 2^k * a + r becomes 3^c * a + d after k
+    (3n+1)/2-or-n/2 steps, c of them odd; the table holds
+    3^c, d and c for every r.
+
+    Takes in an integer, returns a tuple of three lists.
+    """
+    assert bits > 0
+    size = 1 << bits
+    mult = [0] * size
+    add  = [0] * size
+    odds = [0] * size
+    for r in xrange(size):
+        m = size
+        d = r
+        c = 0
+        for step in xrange(bits):
+            if d & 1:
+                m = m * 3 >> 1
+                d = (d * 3 + 1) >> 1
+                c += 1
+            else:
+                m >>= 1
+                d >>= 1
+        mult[r] = m
+        add[r]  = d
+        odds[r] = c
+    return mult, add, odds
+
+# k and the jump table for it as one tuple,
+# (k, mult, add, odds), so a thread never sees
+# the table of one k with another; built on first
+# use with k = JUMP_BITS (see collatz_jump_bits)
+jump_table = None
+
+def collatz_jump_bits (bits=JUMP_BITS):
+    """
+    sets k for jump_collatz and builds its table
+    bits is k, the steps taken at once
+    return the new (k, mult, add, odds)
+    """
+    global jump_table
+    mult, add, odds = jump_build(bits)
+    jump_table = (bits, mult, add, odds)
+    return jump_table
+
+def jump_collatz (num):
+    """
+    Computes the cycle length of any
+    number via Collatz conjecture, taking
+    k steps at a time from the jump table
+    (see jump_build and collatz_jump_bits).
+
+    Takes in an integer, returns an integer.
+    """
+    assert num > 0
+    if num > BIG_LIMIT:
+        return big_collatz(num)
+    table = jump_table
+    if table is None:
+        table = collatz_jump_bits()
+    bits, mult, add, odds = table
+    mask = (1 << bits) - 1
+
+    # below the end of the lazy cache single steps
+    # find cached numbers sooner than jumps do
+    floor = max(mask, len(cycle_list) - 1)
+    n = num
+    steps = 0
+    num_seen = []
+    cached = 0
+    get = cycle_list.get
+
+    # walk the sequence until it reaches 1
+    # or a number already in the lazy cache
+    while n != 1:
+        cached = get(n)
+        if cached:
+            break
+        num_seen.append((n, steps))
+
+        # from 2^k up the next k steps
+        # cannot pass through 1: jump
+        if n > floor:
+            r = n & mask
+            n = mult[r] * (n >> bits) + add[r]
+            steps += bits + odds[r]
+
+        # below it, step like int_collatz
+        elif n & 1:
+            n = (n * 3 + 1) >> 1
+            steps += 2
+        else:
+            zeros = (n & -n).bit_length() - 1
+            n >>= zeros
+            steps += zeros
+
+    if cached:
+        cycle = steps + cached
+    else:
+        cycle = steps + 1
+
+    # add every number landed on into the lazy cache;
+    # each one is <steps> away from the start
+    put = cycle_list.put
+    for x, x_steps in num_seen:
+        put(x, cycle - x_steps)
+    assert cycle > 0
+    if collatz_stats is not None:
+        collatz_stats.engine(steps, cached)
+    return cycle
+
+# numbers past this take the big_collatz path
+# in int_collatz and jump_collatz
+BIG_LIMIT = 1 << 64
+
+def big_collatz (num):
+    """
+    Computes the cycle length of numbers far past
+    any cache: k steps at a time from the jump table
+    (see jump_build) until the sequence is back under
+    BIG_LIMIT, then int_collatz from there. Every jump
+    is one small multiply, one shift and one add over
+    the whole number, and no number on the way is
+    kept, since none of them could ever be cached.
+
+    Takes in an integer, returns an integer.
+    """
+    assert num > 0
+    table = jump_table
+    if table is None:
+        table = collatz_jump_bits()
+    bits, mult, add, odds = table
+    mask = (1 << bits) - 1
+
+    # strip the trailing zeros at once
+    steps = (num & -num).bit_length() - 1
+    n = num >> steps
+    while n > BIG_LIMIT:
+        r = n & mask
+        n = mult[r] * (n >> bits) + add[r]
+        steps += bits + odds[r]
+
+    if collatz_stats is not None:
+        collatz_stats.engine_steps += steps
+    cycle = steps + int_collatz(n)
+    cycle_list.put(num, cycle)
+    return cycle
+
+# k of the residue classes collatz_fill prunes by
+PRUNE_BITS = 10
+
+def prune_build (bits):
+    """
+    Builds the pruning table for k = bits. Two residues
+    r' < r mod 2^k with the same 3^c and d in the jump
+    table (see jump_build) take n = 2^k * a + r' and
+    m = 2^k * a + r to the same 3^c * a + d after k steps
+    of (3n+1)/2 or n/2, c of them odd, so when a > 0
+    (neither passes 1 first) n and m have the same cycle
+    length; e.g. 8a + 4 and 8a + 5 both reach 3a + 2.
+    The table holds r - r' for the smallest such r',
+    or 0 if r is the smallest.
+
+    Takes in an integer, returns a list.
+    """
+    mult, add, odds = jump_build(bits)
+    first = {}
+    delta = [0] * (1 << bits)
+    for r in xrange(1 << bits):
+        key = (mult[r], add[r])
+        if key in first:
+            delta[r] = r - first[key]
+        else:
+            first[key] = r
+    return delta
+
+# the pruning table collatz_fill uses,
+# None if turned off with collatz_prune
+prune_delta = prune_build(PRUNE_BITS)
+
+def collatz_prune (bits=PRUNE_BITS):
+    """
+    sets k for the residue classes collatz_fill and vector_fill
+    prune by (see prune_build), None turns it off
+    """
+    global prune_delta
+    prune_delta = None
+    if bits:
+        prune_delta = prune_build(bits)
+
+# numbers per lockstep block of vector_fill, and
+# the smallest range worth handing to it at all
+VECTOR_BLOCK     = 1 << 16
+VECTOR_MIN_RANGE = 256
+
+# lanes above this would overflow 3n+1 in uint64
+# and finish on int_collatz instead
+VECTOR_LIMIT = (2 ** 64 - 2) // 3
+
+def vector_cycles (values):
+    """
+    Computes the cycle lengths of a sorted numpy array of
+    distinct uint64 numbers in lockstep and adds the ones
+    inside the cache to the lazy cache.
+
+    Every lane runs until it drops below its own start (its
+    stopping time, only a few steps on average). A lane that
+    stopped on 1, on a number in the lazy cache or on another
+    number of the array is then resolved in vectorized rounds;
+    the remaining stops are all smaller numbers, computed by
+    calling vector_cycles on them first.
+
+    Takes in a numpy array, returns a numpy array of int64.
+    """
+    one   = numpy.uint64(1)
+    three = numpy.uint64(3)
+    limit = numpy.uint64(VECTOR_LIMIT)
+    size  = len(cycle_list)
+    cache = numpy.frombuffer(cycle_list.table, dtype=numpy.uint16)
+
+    count  = len(values)
+    cycles = numpy.zeros(count, dtype=numpy.int64)
+    stops  = numpy.zeros(count, dtype=numpy.uint64)
+    gone   = numpy.zeros(count, dtype=numpy.int64)
+
+    # 1 never drops below itself
+    cycles[values == one] = 1
+    lane  = numpy.flatnonzero(values != one)
+    v     = values[lane]
+    start = v.copy()
+    steps = numpy.zeros(len(v), dtype=numpy.int64)
+
+    while len(v):
+
+        # odd lanes take the (3n+1)/2 step
+        odd = (v & one) == one
+        big = odd & (v > limit)
+        if big.any():
+            for x in numpy.flatnonzero(big):
+                cycles[lane[x]] = steps[x] + int_collatz(int(v[x]))
+            keep  = ~big
+            v     = v[keep]
+            start = start[keep]
+            steps = steps[keep]
+            lane  = lane[keep]
+            odd   = odd[keep]
+        v[odd] = (v[odd] * three + one) >> one
+        steps[odd] += 2
+
+        # then every lane strips its trailing zeros
+        zeros = numpy.log2(v & (~v + one)).astype(numpy.int64)
+        v >>= zeros.astype(numpy.uint64)
+        steps += zeros
+
+        # park the lanes that dropped below their start
+        below = v < start
+        stops[lane[below]] = v[below]
+        gone[lane[below]]  = steps[below]
+        keep  = ~below
+        v     = v[keep]
+        start = start[keep]
+        steps = steps[keep]
+        lane  = lane[keep]
+
+    # parked lanes that stopped on 1 or on
+    # a number in the lazy cache are done
+    parked = numpy.flatnonzero(cycles == 0)
+    known = numpy.zeros(len(parked), dtype=numpy.int64)
+    inside = stops[parked] < size
+    known[inside] = cache[stops[parked[inside]]]
+    known[stops[parked] == one] = 1
+    done = known != 0
+    cycles[parked[done]] = gone[parked[done]] + known[done]
+    parked = parked[~done]
+
+    # parked lanes whose stop is not in the
+    # array need the smaller numbers first
+    pos = numpy.searchsorted(values, stops[parked])
+    found = pos < count
+    found[found] = values[pos[found]] == stops[parked[found]]
+    if not found.all():
+        outside = parked[~found]
+        lower = numpy.unique(stops[outside])
+        lower_cycles = vector_cycles(lower)
+        cycles[outside] = gone[outside] + lower_cycles[numpy.searchsorted(lower, stops[outside])]
+        parked = parked[found]
+        pos = pos[found]
+
+    # parked lanes whose stop is in the array are done
+    # as soon as their stop is; stops only go down,
+    # so every round finishes at least one lane
+    while len(parked):
+        ready = cycles[pos] != 0
+        cycles[parked[ready]] = gone[parked[ready]] + cycles[pos[ready]]
+        parked = parked[~ready]
+        pos = pos[~ready]
+
+    inside = values < size
+    cache[values[inside]] = cycles[inside]
+    return cycles
+
+def vector_fill (lower, upper):
+    """
+    Computes every cycle length in [lower, upper] with numpy
+    (see vector_cycles) and adds it to the lazy cache. Like
+    collatz_fill it skips the numbers that merge with a
+    smaller one (see prune_build) and copies their cycle
+    lengths once the smaller ones are in.
+
+    Takes in two integers, returns the max cycle length of
+    the numbers past the end of the cache (which are not
+    kept), or 0.
+    """
+    assert numpy is not None
+    size = len(cycle_list)
+    cache = numpy.frombuffer(cycle_list.table, dtype=numpy.uint16)
+    lower = max(lower, 1)
+    delta = prune_delta
+    if delta is not None:
+        mask  = numpy.uint64(len(delta) - 1)
+        delta = numpy.array(delta, dtype=numpy.uint64)
+    max_cycle = 0
+    pruned = 0
+    for start in xrange(lower, upper + 1, VECTOR_BLOCK):
+        nums = numpy.arange(start, min(start + VECTOR_BLOCK, upper + 1), dtype=numpy.uint64)
+        if start < size:
+            nums = nums[(nums >= size) | (cache[numpy.minimum(nums, size - 1)] == 0)]
+        if not len(nums):
+            continue
+
+        # a smaller partner in the range is cached by the
+        # time vector_cycles is done, an earlier one only
+        # if it is cached already
+        pruned_nums = None
+        if delta is not None:
+            partners = nums - delta[nums & mask]
+            merged = (nums > mask) & (partners < nums) & (nums < size)
+            merged &= (partners >= lower) | (cache[numpy.minimum(partners, size - 1)] != 0)
+            if merged.any():
+                pruned_nums = nums[merged]
+                partners = partners[merged]
+                nums = nums[~merged]
+
+        cycles = vector_cycles(nums)
+        if pruned_nums is not None:
+            cache[pruned_nums] = cache[partners]
+            pruned += len(pruned_nums)
+        outside = nums >= size
+        if outside.any():
+            max_cycle = max(max_cycle, int(cycles[outside].max()))
+    if collatz_stats is not None:
+        collatz_stats.pruned += pruned
+    return max_cycle
+
+def vector_collatz (num):
+    """
+    Computes the cycle length of one number for the
+    numpy engine; collatz_fill hands whole ranges inside
+    the cache to vector_fill through vector_collatz.fill.
+
+    Takes in an integer, returns an integer.
+    """
+    return int_collatz(num)
+
+vector_collatz.fill = vector_fill
+
+# registry of cycle length engines that max_collatz
+# can pick from by name; every engine takes an integer
+# and returns its cycle length, filling the lazy cache
+
+# timings on RunCollatz.in (1000 queries, cold cache,
+# python 2.7, one run each via RunCollatz.py -e <engine>)
+#   bin    4.03s  bit string reference
+#   int    1.59s  shifts and (3n+1)/2 steps
+#   jump   1.58s  k = 12
+#   numpy  0.55s  numpy 1.16
+# filling the cache for 1..300000 with the engine alone
+#   bin  10.9s
+#   int   0.57s
+# 200 numbers near 3^200 (about 317 bits)
+#   int   0.29s
+#   jump  0.021s  k = 12
+# filling the cache for 1..999999 (numpy 1.16)
+#   int   2.54s
+#   numpy 0.27s
+# filling a cold cache for 900000..999999 only
+#   int   0.57s
+#   numpy 0.15s
+#   jump  0.43s  k = 12
+# one number near 2^e, past BIG_LIMIT both take big_collatz
+#   e      before   after
+#   1000   0.0094s  0.0003s
+#   10000  0.079s   0.0034s
+COLLATZ_ENGINES = {
+                    "bin": bin_collatz,
+                    "int": int_collatz,
+                    "jump": jump_collatz
+                  }
+
+# numpy is optional; without it there is no numpy engine
+if numpy is not None :
+    COLLATZ_ENGINES["numpy"] = vector_collatz
+
+# the engine collatz_eval uses when none is given
+DEFAULT_ENGINE = "int"
+if numpy is not None :
+    DEFAULT_ENGINE = "numpy"
+
+def collatz_engine (name):
+    """
+    Looks up a cycle length engine in COLLATZ_ENGINES.
+
+    Takes in a name or an engine function
+    (returned unchanged), returns a function.
+    """
+    if callable(name):
+        return name
+    if name not in COLLATZ_ENGINES:
+        raise ValueError("unknown collatz engine: %r" % (name,))
+    return COLLATZ_ENGINES[name]
+
 def check_meta (arr_range):
     """
-    Checks if the range inclues any of the keys in 
-    the meta data in META_DICT, starting from the highest number.
+    Checks if the range inclues any of the keys in
+    the meta data in META_DICT, finding the highest
+    one with a bisect on META_KEYS.
 
     Takes in a range list returns a integer.
     """
     assert arr_range != []
-    max_cycle = 0
-    meta_len = len(META_KEYS)
+    lower = arr_range[0]
+    upper = arr_range[-1]
 
-    # starting from the highest number
-    for m in range(1, meta_len+1):
+    # past META_LIMIT the highest key in the
+    # range might not be the highest record
+    if upper > META_LIMIT:
+        return 0
 
-        # cycle through the array of keys
-        # and check if its in the given range
-        if META_KEYS[meta_len - m] in arr_range:
-            max_cycle = META_DICT[META_KEYS[meta_len - m]]
-            break
+    # the highest key not above the range
+    # is the answer if it is in the range
+    k = bisect.bisect_right(META_KEYS, upper) - 1
+    if k >= 0 and META_KEYS[k] >= lower:
+        return META_DICT[META_KEYS[k]]
 
-    # return zero or the max cycle
-    return max_cycle
+    # return zero, no key in the range
+    return 0
 
 def max_collatz (funct_collatz, lower, upper):
     """
@@ -179,11 +1776,13 @@ def max_collatz (funct_collatz, lower, upper):
     Takes in a function, and two integers, and returns an integer.
 
     The function passed should preferably compute the cycle length of
-    a given number according to the Collatz algorithm e.g. bin_collatz.
+    a given number according to the Collatz algorithm e.g. bin_collatz,
+    or be the name of one of the engines in COLLATZ_ENGINES.
 
     lower <= upper
     """
     assert lower <= upper
+    funct_collatz = collatz_engine(funct_collatz)
 
     # math magic: the max cycle
     # will always be found after the
@@ -191,42 +1790,160 @@ def max_collatz (funct_collatz, lower, upper):
     # from 1 to any integer x, where x < 1
     # cuts a lot of computation for some ranges
     if lower <= (upper / 2):
+        if collatz_stats is not None:
+            collatz_stats.clamped += 1
+            collatz_stats.clamped_numbers += upper / 2 - lower
         lower = upper / 2
 
     # check if the range is on the same number
-    elif lower is upper:
+    elif lower == upper:
         return funct_collatz(upper)
 
     # check the meta data
-    arr_range = range(lower, upper+1)
-    max_cycle = check_meta(arr_range)
+    max_cycle = check_meta([lower, upper])
 
     # if the answer wasn't in the meta data
     # find the max traditionally
     if max_cycle != 0:
+        if collatz_stats is not None:
+            collatz_stats.meta_hits += 1
         return max_cycle
-    else:
-        for num in arr_range:
-            
-            # if the cycle for the current number
-            # in the range is in the lazy-cache, fetch it
-            if cycle_list[num] != None:
-                cycle = cycle_list[num]
-
-            # otherwise, go through and compute
-            # the cycle traditionally
-            # then add it to the laz-cache
+
+    # with shards on, they own the cache: every
+    # range is split across them (see ShardPool)
+    if shard_pool is not None:
+        if collatz_stats is not None:
+            collatz_stats.pool_ranges += 1
+        return shard_pool.range_max(lower, upper)
+
+    # big ranges are split across the worker pool
+    if worker_pool is not None and upper - lower >= worker_pool.min_range:
+        if collatz_stats is not None:
+            collatz_stats.pool_ranges += 1
+        return worker_pool.range_max(funct_collatz, lower, upper)
+
+    # with the range-max index on, whole blocks
+    # that were filled before are not scanned again
+    size = len(cycle_list)
+    if range_index is not None and range_index.cache is cycle_list and upper < size:
+        if collatz_stats is not None:
+            collatz_stats.index_ranges += 1
+        return range_index.range_max(funct_collatz, lower, upper)
+
+    max_cycle = collatz_fill(funct_collatz, lower, upper)
+
+    # find the max in the lazy-cache
+    if lower < size:
+        max_cycle = max(max_cycle, cycle_list.range_max(lower, min(upper, size - 1)))
+    return max_cycle
+
+def collatz_numbers (lower, upper):
+    """
+    Takes in two integers, returns an iterator over
+    [lower, upper] like xrange, which only takes
+    numbers below sys.maxint, for ints of any size.
+    """
+    if upper < sys.maxint:
+        return xrange(lower, upper + 1)
+    return itertools.takewhile(lambda num: num <= upper, itertools.count(lower))
+
+def collatz_fill (funct_collatz, lower, upper):
+    """
+    Computes every cycle length in [lower, upper] not in
+    the lazy cache yet and adds it to the lazy cache.
+
+    Takes in a function and two integers, returns the max
+    cycle length of the numbers past the end of the cache
+    (which range_max does not see), or 0.
+    """
+    # nothing to do for a range already cached
+    if cycle_list.filled(max(lower, 1), upper):
+        if collatz_stats is not None:
+            collatz_stats.cache_hits += upper - max(lower, 1) + 1
+        return 0
+
+    # engines with a bulk fill (the numpy engine)
+    # take big enough ranges inside the cache all at
+    # once; past the end the loop below keeps every
+    # number in the high tier, which the bulk fill does not
+    fill = getattr(funct_collatz, "fill", None)
+    size = len(cycle_list)
+    if fill is not None and min(upper, size - 1) - lower >= VECTOR_MIN_RANGE \
+       and hasattr(cycle_list, "table"):
+        if collatz_stats is not None:
+            collatz_stats.bulk_fills += 1
+        fill(lower, min(upper, size - 1))
+        if upper < size:
+            return 0
+        lower = size
+
+    # a cache that evicts (see BudgetCache) can drop the
+    # start of the range before range_max reads it, so
+    # then the max of every number is tracked here
+    size = 0 if getattr(cycle_list, "evicts", False) else len(cycle_list)
+    max_cycle = 0
+    misses = 0
+    pruned = 0
+    delta = prune_delta
+    mask = len(delta) - 1 if delta is not None else -1
+    for num in collatz_numbers(max(lower, 1), upper):
+
+        # if the cycle for the current number
+        # in the range is not in the lazy-cache
+        # go through and compute the cycle
+        # traditionally then add it to the lazy-cache
+        cycle = cycle_list.recall(num)
+        if not cycle:
+
+            # a smaller number merges with this one
+            # (see prune_build): same cycle length,
+            # cached if it is in the range
+            if mask >= 0 and num > mask and delta[num & mask]:
+                cycle = cycle_list.recall(num - delta[num & mask])
+            if cycle:
+                pruned += 1
             else:
                 cycle = funct_collatz(num)
-                cycle_list[num] = cycle
+                misses += 1
+            cycle_list.keep(num, cycle)
 
-    # find the max in the lazy-cache
-    return max(cycle_list[lower:upper+1])
+        # numbers past the end of the cache are
+        # not in range_max, so track their max here
+        if num >= size and cycle > max_cycle:
+            max_cycle = cycle
+
+    if collatz_stats is not None:
+        collatz_stats.cache_misses += misses
+        collatz_stats.pruned       += pruned
+        collatz_stats.cache_hits   += upper - max(lower, 1) + 1 - misses - pruned
+    return max_cycle
+
+# default queries the result cache keeps
+RESULT_LIMIT = 1 << 16
 
-def collatz_eval (i, j) :
+# the results collatz_eval answers repeated queries
+# from, keyed by collatz_range(i, j) so (10, 1), (1, 10)
+# and (5, 10) share one entry; a HighCache, so it evicts
+# roughly least recently used (see collatz_result_cache)
+result_cache = HighCache(RESULT_LIMIT)
+
+def collatz_result_cache (limit=RESULT_LIMIT) :
+    """
+    replaces the result cache with an empty one
+    limit is the queries it keeps, 0 turns it off
+    return the new result cache or None
+    """
+    global result_cache
+    result_cache = None
+    if limit :
+        result_cache = HighCache(limit)
+    return result_cache
+
+def collatz_eval (i, j, engine=None) :
     """
     i is the beginning of the range, inclusive
     j is the end       of the range, inclusive
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
     return the max cycle length in the range [i, j]
     """
     assert i > 0
@@ -243,13 +1960,301 @@ def collatz_eval (i, j) :
     assert lower <= upper
 
     # find the max of the range given
-    # pass in the function bin_collatz
-    # that will me used in the computation
-    v = max_collatz(bin_collatz, lower, upper)
-    
+    # pass in the engine that will
+    # be used in the computation
+    if engine is None:
+        engine = DEFAULT_ENGINE
+
+    # read once, collatz_metrics can swap it
+    # on another thread while this one runs
+    stats = collatz_stats
+    if stats is not None:
+        start = time.time()
+
+    # a range asked for before is answered
+    # without check_meta or max_collatz
+    cache = result_cache
+    v = 0
+    if cache is not None:
+        key = collatz_range(lower, upper)
+        v = cache.get(key)
+        if v and stats is not None:
+            stats.result_hits += 1
+    if not v:
+        v = max_collatz(engine, lower, upper)
+        if cache is not None:
+            cache.keep(key, v)
+
+    if stats is not None:
+        stats.query(i, j, v, time.time() - start)
     assert v > 0
     return v
 
+def collatz_range (i, j) :
+    """
+    i is the beginning of the range, inclusive
+    j is the end       of the range, inclusive
+    return the range [lower, upper] max_collatz really
+    searches: ordered, with the upper/2 lower bound applied
+    """
+    assert i > 0
+    assert j > 0
+    lower = min(i, j)
+    upper = max(i, j)
+    if lower <= (upper / 2):
+        lower = upper / 2
+    return lower, upper
+
+# default numbers per chunk of collatz_cycle_chunks
+STREAM_CHUNK = 1 << 12
+
+def collatz_cycle_chunks (i, j, engine=None, chunk=STREAM_CHUNK) :
+    """
+    i is the beginning of the range, inclusive
+    j is the end       of the range, inclusive
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    chunk is the most pairs per list
+    yields lists of (n, cycle length) pairs for every n in
+    the range, in increasing order; each chunk is filled into
+    the module cache (see collatz_fill) just before it is
+    yielded, so the range is never held all at once
+    """
+    assert i > 0
+    assert j > 0
+    assert chunk > 0
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    funct_collatz = collatz_engine(engine)
+    lower = min(i, j)
+    upper = max(i, j)
+
+    start = lower
+    while start <= upper :
+        end = min(start + chunk - 1, upper)
+        size = len(cycle_list)
+
+        # the part inside the cache is filled,
+        # then read back from it
+        if start < size :
+            top = min(end, size - 1)
+            collatz_fill(funct_collatz, start, top)
+            get = cycle_list.get
+            pairs = [(n, get(n) or funct_collatz(n)) for n in xrange(start, top + 1)]
+        else :
+            top = start - 1
+            pairs = []
+
+        # past it the cache only keeps some
+        # numbers, so each is looked up or computed
+        for n in collatz_numbers(top + 1, end) :
+            cycle = cycle_list.recall(n)
+            if not cycle :
+                cycle = funct_collatz(n)
+                cycle_list.keep(n, cycle)
+            pairs.append((n, cycle))
+        yield pairs
+        start = end + 1
+
+def collatz_cycles (i, j, engine=None, chunk=STREAM_CHUNK) :
+    """
+    i is the beginning of the range, inclusive
+    j is the end       of the range, inclusive
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    chunk is the numbers filled at a time
+    yields (n, cycle length) for every n in the range,
+    in increasing order (see collatz_cycle_chunks)
+    """
+    for pairs in collatz_cycle_chunks(i, j, engine, chunk) :
+        for pair in pairs :
+            yield pair
+
+# the metrics collatz_trajectory finds, in order:
+#   cycle the cycle length
+#   peak  the highest number the sequence reaches
+#   odd   the number of 3n+1 steps
+#   stop  the stopping time, the steps until the sequence
+#         first drops below where it started (0 for 1)
+TRAJECTORY_METRICS = ("cycle", "peak", "odd", "stop")
+
+class TrajectoryCache (object) :
+    """
+    A lazy cache of the metrics of collatz_trajectory
+    for 0 <= n < size, kept next to the cycle cache.
+
+    Peaks are doubles, exact up to 2^53 (the highest
+    peak below 10^6 is under 2^36); the rest are unsigned
+    16 bit ints. A peak of 0 marks a number whose
+    metrics are not computed yet.
+    """
+
+    def __init__ (self, size) :
+        self.size  = size
+        self.cycle = array("H", [0]) * size
+        self.peak  = array("d", [0]) * size
+        self.odd   = array("H", [0]) * size
+        self.stop  = array("H", [0]) * size
+
+    def __len__ (self) :
+        return self.size
+
+    def get (self, n) :
+        """
+        Takes in an integer, returns its cached metrics
+        as a tuple or None if they are not cached.
+        """
+        if n < self.size and self.peak[n] :
+            return self.cycle[n], int(self.peak[n]), self.odd[n], self.stop[n]
+        return None
+
+    def put (self, n, metrics) :
+        """
+        Caches the metrics of n if n is inside the cache.
+        """
+        # the peak goes in last: once it is not 0,
+        # a reader on another thread sees them all
+        if n < self.size :
+            self.cycle[n], peak, self.odd[n], self.stop[n] = metrics
+            self.peak[n] = peak
+
+    def range_max (self, metric, lower, upper) :
+        """
+        Takes in a name in TRAJECTORY_METRICS and two
+        integers, returns the max cached metric in
+        [lower, upper] without copying the whole range.
+        """
+        assert 0 <= lower <= upper < self.size
+        table = getattr(self, metric)
+        best = 0
+        for start in xrange(lower, upper + 1, RANGE_MAX_CHUNK) :
+            end = min(start + RANGE_MAX_CHUNK, upper + 1)
+            best = max(best, max(table[start:end]))
+        return int(best)
+
+    def filled (self, lower, upper) :
+        """
+        Takes in two integers, returns True if every
+        number in [lower, upper] is cached.
+        """
+        return upper < self.size and not self.peak[lower:upper + 1].count(0)
+
+# the trajectory cache, None until collatz_trajectory
+# first needs it or collatz_trajectory_cache sets it
+trajectory_list = None
+
+def collatz_trajectory_cache (size=MAX_RANGE) :
+    """
+    replaces the trajectory cache
+    size is the numbers it keeps, from 0
+    return the new cache
+    """
+    global trajectory_list
+    trajectory_list = TrajectoryCache(size)
+    return trajectory_list
+
+def collatz_trajectory (num) :
+    """
+    Computes the metrics in TRAJECTORY_METRICS of any
+    number in one walk of its sequence. The walk stops
+    where the sequence first drops below its start and
+    takes the rest of the metrics from the number it
+    dropped to, from the trajectory cache or, if it is
+    not cached, from that number's own walk, and so on.
+    Filling a range upwards, each number only walks
+    its stopping time.
+
+    Takes in an integer, returns a tuple of four integers.
+    """
+    assert num > 0
+    cache = trajectory_list
+    if cache is None :
+        cache = collatz_trajectory_cache()
+    get = cache.get
+    walks = []
+    start = num
+    rest = (1, 1, 0, 0)
+
+    while start != 1 :
+        n = start
+        steps = 0
+        peak = start
+        odd = 0
+        while n >= start :
+
+            # odd case: 3n+1, the only step up,
+            # then (3n+1)/2, which is still above n
+            if n & 1 :
+                n = n * 3 + 1
+                if n > peak :
+                    peak = n
+                n >>= 1
+                steps += 2
+                odd += 1
+
+            # even case: n/2, the only step down
+            else :
+                n >>= 1
+                steps += 1
+
+        walks.append((start, steps, peak, odd))
+        rest = (1, 1, 0, 0) if n == 1 else get(n)
+        if rest :
+            break
+        start = n
+
+    # the walks from the last one back: each one's
+    # metrics are its own and those of the next
+    if num == 1 :
+        cache.put(1, rest)
+    while walks :
+        start, steps, peak, odd = walks.pop()
+        rest = (steps + rest[0], max(peak, rest[1]), odd + rest[2], steps)
+        cache.put(start, rest)
+        cycle_list.put(start, rest[0])
+    return rest
+
+def collatz_eval_metric (i, j, metric="peak") :
+    """
+    i is the beginning of the range, inclusive
+    j is the end       of the range, inclusive
+    metric is a name in TRAJECTORY_METRICS
+    return the max of the metric in the range [i, j]
+    (see collatz_trajectory); every number the range
+    computes is kept in the trajectory cache
+    """
+    assert i > 0
+    assert j > 0
+    if metric not in TRAJECTORY_METRICS :
+        raise ValueError("unknown trajectory metric: %r" % (metric,))
+    k = TRAJECTORY_METRICS.index(metric)
+    lower = min(i, j)
+    upper = max(i, j)
+
+    # 2n has the cycle length, peak and odd steps
+    # of n or more, so the upper/2 lower bound holds
+    # for those; 2n always stops after 1 step
+    if metric != "stop" and lower <= (upper / 2) :
+        lower = upper / 2
+
+    cache = trajectory_list
+    if cache is None :
+        cache = collatz_trajectory_cache()
+    size = len(cache)
+    best = 0
+    if lower < size :
+        top = min(upper, size - 1)
+        if not cache.filled(lower, top) :
+            get = cache.get
+            for n in xrange(lower, top + 1) :
+                if not get(n) :
+                    collatz_trajectory(n)
+        best = cache.range_max(metric, lower, top)
+
+    # numbers past the end of the cache
+    for n in collatz_numbers(max(lower, size), upper) :
+        best = max(best, collatz_trajectory(n)[k])
+    assert best > 0 or metric != "cycle"
+    return best
+
 # -------------
 # collatz_print
 # -------------
@@ -264,17 +2269,868 @@ def collatz_print (w, i, j, v) :
     """
     w.write(str(i) + " " + str(j) + " " + str(v) + "\n")
 
+def collatz_print_all (w, results, lines=WRITE_LINES) :
+    """
+    prints every (i, j, v) in results, lines at a time
+    w is a writer
+    results is an iterable of (i, j, v)
+    """
+    buf = []
+    for r in results :
+        buf.append("%d %d %d\n" % r)
+        if len(buf) >= lines :
+            w.write("".join(buf))
+            buf = []
+    if buf :
+        w.write("".join(buf))
+
+def collatz_print_binary (w, results, lines=WRITE_LINES) :
+    """
+    writes every (i, j, v) in results as binary
+    results (see WIRE_RESULT), lines at a time
+    w is a binary writer
+    results is an iterable of (i, j, v)
+    """
+    w.write(WIRE_HEADER.pack(WIRE_RESULT_MAGIC, WIRE_VERSION))
+    pack = WIRE_RESULT.pack
+    buf = []
+    for r in results :
+        buf.append(pack(*r))
+        if len(buf) >= lines :
+            w.write("".join(buf))
+            buf = []
+    if buf :
+        w.write("".join(buf))
+
+def collatz_write_queries (w, queries) :
+    """
+    writes every (i, j) in queries as binary
+    queries (see WIRE_QUERY)
+    w is a binary writer
+    queries is an iterable of (i, j)
+    """
+    w.write(WIRE_HEADER.pack(WIRE_QUERY_MAGIC, WIRE_VERSION))
+    w.write("".join(WIRE_QUERY.pack(i, j) for i, j in queries))
+
 # -------------
 # collatz_solve
 # -------------
 
-def collatz_solve (r, w) :
+def collatz_solve (r, w, engine=None) :
     """
     read, eval, print loop
+    binary queries (see WIRE_QUERY_MAGIC) are answered
+    with binary results, anything else is read as text
     r is a reader
     w is a writer
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
     """
+    head = r.read(len(WIRE_QUERY_MAGIC))
+    if head == WIRE_QUERY_MAGIC :
+        collatz_solve_binary(head, r, w, engine)
+        return
+    r = PrefixReader(head, r)
+
     a = [0, 0]
     while collatz_read(r, a) :
-        v = collatz_eval(a[0], a[1])
+        v = collatz_eval(a[0], a[1], engine)
         collatz_print(w, a[0], a[1], v)
+
+def collatz_solve_binary (head, r, w, engine=None) :
+    """
+    read, eval, print loop over binary queries;
+    a file is memory-mapped and read in place
+    head is what was already read of r
+    r is a reader, past head
+    w is a binary writer
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    """
+    data = collatz_map(head, r)
+    try :
+        results = ((i, j, collatz_eval(i, j, engine)) for i, j in collatz_read_binary(data))
+        collatz_print_binary(w, results)
+    finally :
+        if isinstance(data, mmap.mmap) :
+            data.close()
+
+def collatz_map (head, r) :
+    """
+    head is what was already read of r
+    r is a reader, past head
+    return all of r: an mmap of a file, a string otherwise
+    """
+    try :
+        if os.fstat(r.fileno()).st_size > len(head) :
+            return mmap.mmap(r.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError) :
+        pass
+    return head + r.read()
+
+def collatz_read_queries (r) :
+    """
+    reads every query, binary (see WIRE_QUERY_MAGIC)
+    or text (see collatz_read_all)
+    r is a reader
+    return a list of (i, j) pairs and True if they were binary
+    """
+    head = r.read(len(WIRE_QUERY_MAGIC))
+    if head != WIRE_QUERY_MAGIC :
+        return collatz_read_all(PrefixReader(head, r)), False
+    data = collatz_map(head, r)
+    try :
+        return list(collatz_read_binary(data)), True
+    finally :
+        if isinstance(data, mmap.mmap) :
+            data.close()
+
+def collatz_plan (queries) :
+    """
+    queries is a list of (i, j) pairs
+    return the union of the ranges the queries search
+    (see collatz_range) as a sorted list of disjoint
+    [lower, upper] pairs
+    """
+    ranges = sorted(collatz_range(i, j) for i, j in queries)
+    plan = []
+    for lower, upper in ranges :
+        if plan and lower <= plan[-1][1] + 1 :
+            if upper > plan[-1][1] :
+                plan[-1][1] = upper
+        else :
+            plan.append([lower, upper])
+    return plan
+
+def collatz_solve_batch (r, w, engine=None) :
+    """
+    read all, eval, print
+    reads every query first (collatz_read_all), answers the
+    ones in the result cache or the meta data, fills the union
+    of the rest of their ranges (see collatz_plan) in one pass,
+    then answers those from block maxima over the cache (see
+    RangeMaxIndex) and prints every query in input order
+    (collatz_print_all); binary queries are answered with
+    binary results (see collatz_read_queries)
+    r is a reader
+    w is a writer
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    """
+    queries, binary = collatz_read_queries(r)
+
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    funct_collatz = collatz_engine(engine)
+
+    # queries asked before or holding a record
+    # holder are answered without the cache
+    cache = result_cache
+    results = []
+    pending = []
+    for i, j in queries :
+        key = collatz_range(i, j)
+        v = cache.get(key) if cache is not None else 0
+        if v :
+            if collatz_stats is not None:
+                collatz_stats.result_hits += 1
+        else :
+            v = check_meta(key)
+            if v and collatz_stats is not None:
+                collatz_stats.meta_hits += 1
+        if not v :
+            pending.append(len(results))
+        results.append((i, j, v))
+
+    # one pass over the union of the rest of the
+    # ranges, only the part inside the cache; ranges
+    # past it are answered by collatz_eval below
+    size = len(cycle_list)
+    for lower, upper in collatz_plan([queries[k] for k in pending]) :
+        if lower >= size :
+            break
+        upper = min(upper, size - 1)
+        if worker_pool is not None and upper - lower >= worker_pool.min_range :
+            worker_pool.range_max(funct_collatz, lower, upper)
+        else :
+            collatz_fill(funct_collatz, lower, upper)
+
+    # whole blocks are scanned once for the batch
+    # (or not at all with the range-max index on);
+    # the index also refills what a cache that
+    # evicts lost since the pass above
+    index = range_index
+    if index is None or index.cache is not cycle_list :
+        index = RangeMaxIndex(cycle_list)
+    for k in pending :
+        i, j, v = results[k]
+        lower, upper = collatz_range(i, j)
+        if upper < size :
+            v = index.range_max(funct_collatz, lower, upper)
+            if cache is not None :
+                cache.keep((lower, upper), v)
+        else :
+            v = collatz_eval(i, j, engine)
+        results[k] = (i, j, v)
+    if binary :
+        collatz_print_binary(w, results)
+    else :
+        collatz_print_all(w, results)
+
+# default threads of collatz_eval_threads
+EVAL_THREADS = 4
+
+def collatz_eval_threads (queries, engine=None, threads=EVAL_THREADS) :
+    """
+    runs collatz_eval on every query across a pool of
+    threads that share the module cache (see CycleCache)
+    queries is a list of (i, j) pairs
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    threads is the number of threads
+    return a list of (i, j, v) in the order of queries
+    """
+    pool = multiprocessing.pool.ThreadPool(threads)
+    try :
+        values = pool.map(lambda q : collatz_eval(q[0], q[1], engine), queries)
+    finally :
+        pool.close()
+        pool.join()
+    return [(i, j, v) for (i, j), v in zip(queries, values)]
+
+def collatz_solve_threads (r, w, engine=None, threads=EVAL_THREADS) :
+    """
+    read all, eval on many threads, print
+    (see collatz_eval_threads); binary queries are answered
+    with binary results (see collatz_read_queries)
+    r is a reader
+    w is a writer
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    threads is the number of threads
+    """
+    queries, binary = collatz_read_queries(r)
+    results = collatz_eval_threads(queries, engine, threads)
+    if binary :
+        collatz_print_binary(w, results)
+    else :
+        collatz_print_all(w, results)
+
+# -------------
+# collatz_table
+# -------------
+
+def collatz_build_table (w, size, engine=None, tree=False) :
+    """
+    computes the cycle lengths of 1..size and
+    writes them as a table for collatz_load_table
+    w is a binary writer
+    size is the highest number in the table
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    tree is True to fill it with collatz_tree_fill instead
+    """
+    global cycle_list
+    assert size > 0
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    funct_collatz = collatz_engine(engine)
+
+    # the engines fill the module cache, so
+    # swap in one big enough for the whole table
+    saved = cycle_list
+    cycle_list = CycleCache(size + 1)
+    try :
+        if tree :
+            collatz_tree_fill()
+        else :
+            for num in xrange(1, size + 1) :
+                if not cycle_list.get(num) :
+                    cycle_list.put(num, funct_collatz(num))
+        table = cycle_list.table
+    finally :
+        cycle_list = saved
+
+    if sys.byteorder != "little" :
+        table.byteswap()
+    data = table.tostring()
+    crc = table_checksum(data, 0)
+    w.write(TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, 2, len(table), crc))
+    w.write(data)
+
+def tree_grow (table, frontier) :
+    """
+    Takes in a cycle table and a list of numbers in it whose
+    cycle lengths are known, and assigns every number below
+    the end of the table in the inverse tree under them:
+    2n, and (n - 1) / 3 for n = 4 (mod 6) past 4, are one
+    step from n. Every number has one next step, so each
+    one is reached once, with its exact cycle length.
+    """
+    size = len(table)
+    while frontier :
+        grown = []
+        for n in frontier :
+            cycle = table[n] + 1
+            m = n << 1
+            if m < size :
+                table[m] = cycle
+                grown.append(m)
+            if n % 6 == 4 and n > 4 :
+                m = (n - 1) // 3
+                table[m] = cycle
+                grown.append(m)
+        frontier = grown
+
+def vector_grow (table, frontier) :
+    """
+    tree_grow with numpy, a level of the tree
+    at a time: table is a numpy array of uint16
+    and frontier a numpy array of int64
+    """
+    size = len(table)
+    while len(frontier) :
+        cycles  = table[frontier] + 1
+        doubled = frontier << 1
+        inside  = doubled < size
+        odd     = (frontier % 6 == 4) & (frontier > 4)
+        thirds  = (frontier[odd] - 1) // 3
+        table[doubled[inside]] = cycles[inside]
+        table[thirds] = cycles[odd]
+        frontier = numpy.concatenate((doubled[inside], thirds))
+
+def tree_walk (table, n) :
+    """
+    Takes in a cycle table and a number, returns its cycle
+    length by single steps up to a number in the table
+    whose cycle length is known.
+    """
+    size = len(table)
+    steps = 0
+    while n >= size or not table[n] :
+        if n & 1 :
+            n = 3 * n + 1
+        else :
+            n >>= 1
+        steps += 1
+    return steps + table[n]
+
+def vector_walk (table, values) :
+    """
+    tree_walk with numpy, every number of values at
+    once in lockstep: table is a numpy array of uint16
+    and values a numpy array of int64; returns their
+    cycle lengths as a numpy array of int64
+    """
+    one    = numpy.uint64(1)
+    three  = numpy.uint64(3)
+    limit  = numpy.uint64(VECTOR_LIMIT)
+    size   = numpy.uint64(len(table))
+    cycles = numpy.zeros(len(values), dtype=numpy.int64)
+    lane   = numpy.arange(len(values))
+    v      = values.astype(numpy.uint64)
+    steps  = numpy.zeros(len(v), dtype=numpy.int64)
+
+    while len(v):
+
+        # odd lanes take the (3n+1)/2 step, past
+        # VECTOR_LIMIT they finish in tree_walk
+        odd = (v & one) == one
+        big = odd & (v > limit)
+        if big.any():
+            for x in numpy.flatnonzero(big):
+                cycles[lane[x]] = steps[x] + tree_walk(table, int(v[x]))
+            keep  = ~big
+            v     = v[keep]
+            steps = steps[keep]
+            lane  = lane[keep]
+            odd   = odd[keep]
+        v[odd] = (v[odd] * three + one) >> one
+        steps[odd] += 2
+
+        # then every lane strips its trailing zeros
+        zeros = numpy.log2(v & (~v + one)).astype(numpy.int64)
+        v >>= zeros.astype(numpy.uint64)
+        steps += zeros
+
+        # lanes on a number of the tree are done
+        inside = numpy.flatnonzero(v < size)
+        known  = table[v[inside].astype(numpy.int64)].astype(numpy.int64)
+        done   = inside[known != 0]
+        cycles[lane[done]] = steps[done] + known[known != 0]
+        keep  = numpy.ones(len(v), dtype=bool)
+        keep[done] = False
+        v     = v[keep]
+        steps = steps[keep]
+        lane  = lane[keep]
+    return cycles
+
+# filling a cold cache of 1..N (BenchCollatz.py -F N,
+# python 2.7, numpy 1.16, one run each):
+#   N       int     numpy   tree    tree without numpy
+#   10^6     2.16s   0.31s   0.16s   0.65s
+#   10^7    24.45s   2.86s   1.32s   7.70s
+#   10^8      -     30.84s  11.50s     -
+def collatz_tree_fill () :
+    """
+    fills every cycle length of the lazy cache (a CycleCache)
+    by growing the inverse Collatz tree from 1 (see tree_grow)
+    instead of walking forward from every number.
+    Grown below the end of the cache, the tree only reaches
+    the numbers whose trajectories stay below it (40% of
+    1..10^6); every other number is under one root: an odd
+    number whose 3n+1 is past the end and whose trajectory
+    does not come back to the tree. Only the roots are
+    walked forward (with numpy, in lockstep by vector_walk),
+    up to a number of the tree, then it is grown from them.
+    """
+    size = len(cycle_list)
+    assert size > 1
+    first = (size + 1) // 3 | 1
+
+    if numpy is None :
+        table = cycle_list.table
+        table[1] = 1
+        tree_grow(table, [1])
+        roots = [n for n in xrange(first, size, 2) if not table[n]]
+        for n in roots :
+            table[n] = tree_walk(table, n)
+        tree_grow(table, roots)
+        return
+
+    # the roots are walked a block at a time, and the
+    # tree grown from them, so the walks of later blocks
+    # can stop on the trees of the blocks before them
+    table = numpy.frombuffer(cycle_list.table, dtype=numpy.uint16)
+    table[1] = 1
+    vector_grow(table, numpy.array([1], dtype=numpy.int64))
+    for start in xrange(first, size, 2 * VECTOR_BLOCK) :
+        roots = numpy.arange(start, min(start + 2 * VECTOR_BLOCK, size), 2, dtype=numpy.int64)
+        roots = roots[table[roots] == 0]
+        table[roots] = vector_walk(table, roots)
+        vector_grow(table, roots)
+
+# the most numbers collatz_build_records keeps in its
+# cache; bigger numbers are resolved through it
+RECORD_CACHE = 10 ** 8
+
+def collatz_records (limit, engine=None) :
+    """
+    finds the record holders in 1..limit: the numbers whose
+    cycle length is longer than that of every smaller number
+    limit is the highest number searched
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None;
+    with numpy, vector_cycles does the work whatever the engine
+    return a list of (n, cycle) pairs in order
+    """
+    global cycle_list
+    assert limit > 0
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    funct_collatz = collatz_engine(engine)
+
+    # the engines fill the module cache, so swap in
+    # one big enough for the whole search (or capped)
+    saved = cycle_list
+    cycle_list = CycleCache(min(limit, RECORD_CACHE) + 1)
+    records = []
+    best = 0
+    try :
+        for start in xrange(1, limit + 1, VECTOR_BLOCK) :
+            end = min(start + VECTOR_BLOCK - 1, limit)
+            if numpy is not None :
+                nums   = numpy.arange(start, end + 1, dtype=numpy.uint64)
+                cycles = vector_cycles(nums)
+                tops   = numpy.maximum(numpy.maximum.accumulate(cycles), best)
+                before = numpy.concatenate(([best], tops[:-1]))
+                for k in numpy.flatnonzero(tops > before) :
+                    records.append((int(nums[k]), int(cycles[k])))
+                best = int(tops[-1])
+            else :
+                for num in xrange(start, end + 1) :
+                    cycle = cycle_list.get(num)
+                    if not cycle :
+                        cycle = funct_collatz(num)
+                        cycle_list.put(num, cycle)
+                    if cycle > best :
+                        records.append((num, cycle))
+                        best = cycle
+    finally :
+        cycle_list = saved
+    return records
+
+def collatz_build_records (w, limit, engine=None) :
+    """
+    finds the record holders in 1..limit (see collatz_records)
+    and writes them for collatz_load_records
+    w is a binary writer
+    limit is the highest number searched
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    """
+    records = collatz_records(limit, engine)
+    w.write(RECORD_HEADER.pack(RECORD_MAGIC, RECORD_VERSION, len(records), limit))
+    for n, cycle in records :
+        w.write(RECORD_ENTRY.pack(n, cycle))
+
+def collatz_load_table (path, verify=True) :
+    """
+    memory-maps a table written by collatz_build_table
+    and uses it as the cycle cache; numbers past the
+    table keep using the current cache
+    path is the table file
+    verify checks the crc32 of the table
+    """
+    global cycle_list
+    cycle_list = MappedCycleCache(path, cycle_list, verify)
+    if range_index is not None :
+        collatz_range_index(range_index.block)
+
+# default numbers per block of the
+# maxima collatz_build_sphere embeds
+SPHERE_BLOCK = 100
+
+def collatz_block_maxima (size, block, engine=None) :
+    """
+    computes the max cycle length of every whole
+    block of <block> numbers in 0..size-1
+    size is the numbers covered
+    block is the numbers per block
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    return an array of unsigned 16 bit ints
+    """
+    global cycle_list
+    assert 0 < block <= size
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    funct_collatz = collatz_engine(engine)
+
+    # the engines fill the module cache, so
+    # swap in one big enough for every block
+    saved = cycle_list
+    cycle_list = CycleCache(size)
+    try :
+        collatz_fill(funct_collatz, 1, size - 1)
+        return array("H", [cycle_list.range_max(k * block, k * block + block - 1)
+                           for k in xrange(size // block)])
+    finally :
+        cycle_list = saved
+
+def collatz_load_maxima (text, block) :
+    """
+    turns on the range-max index with its block maxima
+    already known, from collatz_block_maxima as a base64
+    string of the zlib compressed little endian array;
+    queries then only fill the partial blocks at either
+    end of their range
+    text is the string
+    block is the numbers per block of the maxima
+    """
+    maxima = array("H")
+    maxima.fromstring(zlib.decompress(base64.b64decode(text)))
+    if sys.byteorder != "little" :
+        maxima.byteswap()
+    collatz_range_index(block)
+    n = min(len(maxima), len(range_index.maxima))
+    range_index.maxima[:n] = maxima[:n]
+
+def collatz_build_sphere (w, size=MAX_RANGE, block=SPHERE_BLOCK, engine=None) :
+    """
+    writes the single file SphereCollatz.py: this module's
+    source, the block maxima of 0..size-1 (see
+    collatz_block_maxima) for collatz_load_maxima, and a
+    read, eval, print loop on stdin and stdout
+    w is a writer
+    size is the numbers the maxima cover; past the
+    cycle cache they are not used
+    block is the numbers per block
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    """
+    maxima = collatz_block_maxima(size, block, engine)
+    if sys.byteorder != "little" :
+        maxima.byteswap()
+    text = base64.b64encode(zlib.compress(maxima.tostring(), 9))
+
+    f = open(os.path.splitext(os.path.abspath(__file__))[0] + ".py")
+    try :
+        source = f.read()
+    finally :
+        f.close()
+
+    # the single file has its own name in the header
+    # and its imports in a section of their own
+    name = "# projects/collatz/SphereCollatz.py\n"
+    rule = "# " + "-" * (len(name) - 3) + "\n"
+    head, body = source.split("# ------------\n# collatz_read\n# ------------\n\n", 1)
+    imports, body = body.split("\n\n", 1)
+    head = head.replace("# projects/collatz/Collatz.py\n", name)
+    head = head.replace("# " + "-" * 27 + "\n", rule)
+
+    w.write(head)
+    w.write("# generated by BuildCollatz.py -s from Collatz.py\n\n")
+    w.write("# -------\n# imports\n# -------\n\n" + imports + "\n\n")
+    w.write("# ------------\n# collatz_read\n# ------------\n\n" + body.rstrip("\n") + "\n\n")
+    w.write("# ------\n# sphere\n# ------\n\n")
+    w.write("SPHERE_MAXIMA = \"\"\"\n")
+    for k in xrange(0, len(text), 76) :
+        w.write(text[k:k + 76] + "\n")
+    w.write("\"\"\"\n\n")
+    w.write("# ----\n# main\n# ----\n\n")
+    w.write("collatz_load_maxima(SPHERE_MAXIMA, %d)\n" % block)
+    w.write("collatz_solve(sys.stdin, sys.stdout)\n")
+
+# -------------
+# collatz_serve
+# -------------
+
+class CollatzHandler (SocketServer.StreamRequestHandler) :
+    """
+    answers "i j" lines with "i j v" lines, as collatz_solve
+    does, until the client closes; a client may send many
+    queries before it reads any answers, and a bad line is
+    answered with a "line N: ..." error line (see
+    collatz_parse) instead of ending the session
+    """
+
+    def setup (self) :
+        SocketServer.StreamRequestHandler.setup(self)
+        if self.connection.family != socket.AF_UNIX :
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def handle (self) :
+        server = self.server
+        line_no = 0
+        for line in iter(self.rfile.readline, "") :
+            line_no += 1
+            pairs = []
+            try :
+                collatz_parse(line, line_no - 1, pairs)
+                i, j = pairs[0]
+                v = collatz_eval(i, j, server.engine)
+            except ValueError as e :
+                self.wfile.write("%s\n" % e)
+                continue
+            except (IndexError, AssertionError) :
+                self.wfile.write("line %d: could not answer %r\n" % (line_no, line.rstrip("\r\n")))
+                continue
+            collatz_print(self.wfile, i, j, v)
+
+class CollatzTCPServer (SocketServer.ThreadingMixIn, SocketServer.TCPServer) :
+    allow_reuse_address = True
+    daemon_threads      = True
+
+if hasattr(socket, "AF_UNIX") :
+    class CollatzUnixServer (SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer) :
+        daemon_threads = True
+
+def collatz_server (address, engine=None) :
+    """
+    makes a server that answers queries from many clients
+    at once, each on its own thread, out of the module cache,
+    which stays warm for as long as the server runs
+    address is a (host, port) pair for TCP or a path for
+    a Unix socket
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    return the server, bound; call serve_forever to start it
+    """
+    if engine is None:
+        engine = DEFAULT_ENGINE
+    collatz_engine(engine)
+    if isinstance(address, str) :
+        server = CollatzUnixServer(address, CollatzHandler)
+    else :
+        server = CollatzTCPServer(address, CollatzHandler)
+    server.engine = engine
+    return server
+
+# --------------
+# collatz_shards
+# --------------
+
+# the small numbers every shard keeps a copy of,
+# since every trajectory ends among them
+SHARD_PREFIX = 1 << 16
+
+class ShardCache (object) :
+    """
+    The cycle cache of one shard (see ShardPool): a table
+    for the numbers the shard owns, lower <= n < upper, and
+    its own copy of the numbers below prefix. Numbers in
+    between belong to other shards and are never cached
+    here. Like a CycleCache, its length is where it ends
+    and numbers past the end go to the high tier, if any.
+    """
+
+    def __init__ (self, lower, upper, prefix=SHARD_PREFIX, high=None) :
+        assert 0 <= lower < upper
+        self.lower  = lower
+        self.size   = upper
+        self.prefix = min(prefix, lower)
+        self.own    = array("H", [0]) * (upper - lower)
+        self.low    = array("H", [0]) * self.prefix
+        self.high   = high
+
+    def __len__ (self) :
+        return self.size
+
+    def get (self, n) :
+        """
+        Takes in an integer, returns its cached
+        cycle length or 0 if it is not cached.
+        """
+        if n < self.size :
+            if n >= self.lower :
+                return self.own[n - self.lower]
+            if n < self.prefix :
+                return self.low[n]
+            return 0
+        high = self.high
+        if high is not None and n < high.bound :
+            return high.get(n)
+        return 0
+
+    def put (self, n, cycle) :
+        """
+        Caches the cycle length of n if the shard
+        keeps n, or in the high tier if n is past the end.
+        """
+        if n < self.size :
+            if n >= self.lower :
+                self.own[n - self.lower] = cycle
+            elif n < self.prefix :
+                self.low[n] = cycle
+        elif self.high is not None and n < self.high.bound :
+            self.high.keep(n, cycle)
+
+    def recall (self, n) :
+        """
+        get, but past the end it always
+        looks in the high tier
+        """
+        if n >= self.size :
+            return self.high.get(n) if self.high is not None else 0
+        return self.get(n)
+
+    def keep (self, n, cycle) :
+        """
+        put, but past the end it always
+        goes into the high tier
+        """
+        if n < self.size :
+            self.put(n, cycle)
+        elif self.high is not None :
+            self.high.keep(n, cycle)
+
+    def range_max (self, lower, upper) :
+        """
+        Takes in two integers inside the numbers the shard
+        owns, returns the max cached cycle length in [lower, upper].
+        """
+        assert self.lower <= lower <= upper < self.size
+        own = self.own
+        max_cycle = 0
+        for start in xrange(lower - self.lower, upper - self.lower + 1, RANGE_MAX_CHUNK) :
+            end = min(start + RANGE_MAX_CHUNK, upper - self.lower + 1)
+            max_cycle = max(max_cycle, max(own[start:end]))
+        return max_cycle
+
+    def filled (self, lower, upper) :
+        """
+        Takes in two integers, returns True if every
+        number in [lower, upper] is cached.
+        """
+        return self.lower <= lower and upper < self.size and \
+               not self.own[lower - self.lower:upper - self.lower + 1].count(0)
+
+def shard_serve (server, lower, upper, last) :
+    """
+    Runs in a shard: answers the coordinator's queries
+    from a ShardCache of [lower, upper), and past upper
+    too from a high tier if it is the last shard.
+    """
+    global cycle_list, range_index, worker_pool, shard_pool
+    cycle_list  = ShardCache(lower, upper, high=HighCache(HIGH_LIMIT) if last else None)
+    range_index = None
+    worker_pool = None
+    shard_pool  = None
+    server.serve_forever()
+
+class ShardPool (object) :
+    """
+    Shard processes that each own a contiguous slice of
+    1..size-1 and its cycle cache (see ShardCache); the last
+    one also owns everything past size. Each one is a
+    collatz_server on a loopback socket. range_max splits
+    a range into the slices it covers, sends every piece
+    before it reads any answer, and merges the maxima.
+    """
+
+    def __init__ (self, shards, size=MAX_RANGE, engine=None) :
+        assert 0 < shards < size
+        bounds = [size * k // shards for k in xrange(shards + 1)]
+        self.slices = zip(bounds[:-1], bounds[1:])
+        self.procs  = []
+        addresses   = []
+        for k, (lower, upper) in enumerate(self.slices) :
+            server = collatz_server(("localhost", 0), engine)
+            proc = multiprocessing.Process(target=shard_serve,
+                                           args=(server, lower, upper, k == shards - 1))
+            proc.daemon = True
+            proc.start()
+            addresses.append(server.server_address)
+            server.server_close()
+            self.procs.append(proc)
+
+        # connect once every shard is forked,
+        # so no shard holds another's connection
+        self.conns = []
+        for address in addresses :
+            conn = socket.create_connection(address)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.conns.append((conn, conn.makefile("rb")))
+        self.lock = threading.Lock()
+
+    def range_max (self, lower, upper) :
+        """
+        Takes in two integers, returns the max
+        cycle length in [lower, upper].
+        """
+        assert 0 < lower <= upper
+        last = len(self.slices) - 1
+        pieces = []
+        for k, (start, end) in enumerate(self.slices) :
+            a = max(lower, start)
+            b = upper if k == last else min(upper, end - 1)
+            if a <= b :
+                pieces.append((k, a, b))
+
+        with self.lock :
+            for k, a, b in pieces :
+                self.conns[k][0].sendall("%d %d\n" % (a, b))
+            max_cycle = 0
+            for k, a, b in pieces :
+                line = self.conns[k][1].readline()
+                max_cycle = max(max_cycle, int(line.split()[2]))
+        return max_cycle
+
+    def close (self) :
+        for conn, r in self.conns :
+            r.close()
+            conn.close()
+        for proc in self.procs :
+            proc.terminate()
+            proc.join()
+
+# the shards max_collatz splits every range
+# across, None unless turned on with collatz_shards
+shard_pool = None
+
+def collatz_shards (shards=None, size=MAX_RANGE, engine=None) :
+    """
+    starts shard processes that own the cycle cache
+    shards is the number of processes, all cores if None,
+    0 stops them
+    size is where the last shard's slice ends
+    engine is a name in COLLATZ_ENGINES, DEFAULT_ENGINE if None
+    """
+    global shard_pool
+    if shard_pool is not None :
+        shard_pool.close()
+        shard_pool = None
+    if shards is None :
+        shards = multiprocessing.cpu_count()
+    if shards != 0 :
+        shard_pool = ShardPool(shards, size, engine)
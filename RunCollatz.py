@@ -12,6 +12,40 @@ To run the program
     % chmod ugo+x RunCollatz.py
     % RunCollatz.py < RunCollatz.in > RunCollatz.out
 
+To pick a cycle length engine (see COLLATZ_ENGINES)
+    % python RunCollatz.py -e bin < RunCollatz.in > RunCollatz.out
+
+To start from a table built by BuildCollatz.py
+    % python RunCollatz.py -t Collatz.table < RunCollatz.in > RunCollatz.out
+
+To answer from a range-max index with 1024 numbers per block
+    % python RunCollatz.py -i 1024 < RunCollatz.in > RunCollatz.out
+
+To split big ranges across 4 worker processes, 65536 numbers per task
+    % python RunCollatz.py -w 4 -c 65536 < RunCollatz.in > RunCollatz.out
+
+To answer binary queries (see collatz_write_queries) with binary results;
+a query file is read in place through mmap
+    % python RunCollatz.py < queries.bin > results.bin
+
+To keep the cache inside 64 MB, evicting the least
+recently used 128 KB segments (see BUDGET_POLICIES)
+    % python RunCollatz.py -m 67108864 -P lru < RunCollatz.in > RunCollatz.out
+
+To keep the results of the last 1000000 queries,
+or of none at all (see RESULT_LIMIT)
+    % python RunCollatz.py -r 1000000 < RunCollatz.in > RunCollatz.out
+    % python RunCollatz.py -r 0 < RunCollatz.in > RunCollatz.out
+
+To split the cache and every range across 4 shard processes
+    % python RunCollatz.py -s 4 < RunCollatz.in > RunCollatz.out
+
+To read every query first and fill their ranges in one pass
+    % python RunCollatz.py -b < RunCollatz.in > RunCollatz.out
+
+To read every query first and answer them on 8 threads
+    % python RunCollatz.py -T 8 < RunCollatz.in > RunCollatz.out
+
 To document the program
     % pydoc -w Collatz
 """
@@ -20,12 +54,47 @@ To document the program
 # imports
 # -------
 
+import argparse
 import sys
 
-from Collatz import collatz_solve
+from Collatz import collatz_solve, collatz_solve_batch, collatz_solve_threads, collatz_load_table, collatz_range_index, collatz_workers, \
+                    collatz_shards, collatz_cache_budget, collatz_result_cache, \
+                    POOL_CHUNK, RESULT_LIMIT, BUDGET_POLICIES
 
 # ----
 # main
 # ----
 
-collatz_solve(sys.stdin, sys.stdout)
+parser = argparse.ArgumentParser(description="collatz read, eval, print loop")
+parser.add_argument("-e", "--engine", help="cycle length engine")
+parser.add_argument("-b", "--batch", action="store_true", help="read all queries, then fill and answer")
+parser.add_argument("-t", "--table", help="precomputed cycle length table")
+parser.add_argument("-r", "--results", type=int, default=RESULT_LIMIT, metavar="N", help="query results to cache, 0 for none")
+parser.add_argument("-i", "--index", type=int, metavar="BLOCK", help="range-max index block size")
+parser.add_argument("-w", "--workers", type=int, help="worker processes for big ranges")
+parser.add_argument("-c", "--chunk", type=int, default=POOL_CHUNK, help="numbers per worker task")
+parser.add_argument("-s", "--shards", type=int, help="shard processes that own the cache")
+parser.add_argument("-m", "--memory", type=int, metavar="BYTES", help="memory budget of the cycle cache")
+parser.add_argument("-P", "--policy", choices=BUDGET_POLICIES, default="lru", help="eviction policy of the budget")
+parser.add_argument("-T", "--threads", type=int, help="threads to answer queries on")
+args = parser.parse_args()
+
+if args.results != RESULT_LIMIT :
+    collatz_result_cache(args.results)
+if args.memory :
+    collatz_cache_budget(args.memory, args.policy)
+if args.table :
+    collatz_load_table(args.table)
+if args.index :
+    collatz_range_index(args.index)
+if args.workers :
+    collatz_workers(args.workers, args.chunk)
+if args.shards :
+    collatz_shards(args.shards, engine=args.engine)
+
+if args.batch :
+    collatz_solve_batch(sys.stdin, sys.stdout, args.engine)
+elif args.threads :
+    collatz_solve_threads(sys.stdin, sys.stdout, args.engine, args.threads)
+else :
+    collatz_solve(sys.stdin, sys.stdout, args.engine)
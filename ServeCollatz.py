@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+# --------------------------------
+# projects/collatz/ServeCollatz.py
+# Copyright (C) 2011
+# Glenn P. Downing
+# --------------------------------
+
+"""
+To serve queries on TCP port 8373, one "i j" per line,
+answered with "i j v" lines, keeping the cache warm
+    % python ServeCollatz.py -p 8373
+    % nc localhost 8373 < RunCollatz.in > RunCollatz.out
+
+To serve on a Unix socket instead
+    % python ServeCollatz.py -u /tmp/collatz.sock
+
+To start from a table built by BuildCollatz.py, or
+to fill the cycle lengths of 1..N before serving
+    % python ServeCollatz.py -t Collatz.table -p 8373
+    % python ServeCollatz.py -f 1000000 -p 8373
+
+The -e, -m, -P, -r, -i, -w and -c options are those of RunCollatz.py.
+"""
+
+# -------
+# imports
+# -------
+
+import argparse
+import os
+
+from Collatz import collatz_server, collatz_fill, collatz_engine, collatz_load_table, collatz_range_index, \
+                    collatz_workers, collatz_cache_budget, collatz_result_cache, \
+                    POOL_CHUNK, RESULT_LIMIT, BUDGET_POLICIES
+
+# ----
+# main
+# ----
+
+parser = argparse.ArgumentParser(description="collatz query server")
+parser.add_argument("-p", "--port", type=int, default=8373, help="TCP port")
+parser.add_argument("-H", "--host", default="localhost", help="TCP host")
+parser.add_argument("-u", "--unix", metavar="PATH", help="Unix socket path instead of TCP")
+parser.add_argument("-f", "--fill", type=int, metavar="N", help="fill the cycle lengths of 1..N first")
+parser.add_argument("-e", "--engine", help="cycle length engine")
+parser.add_argument("-t", "--table", help="precomputed cycle length table")
+parser.add_argument("-m", "--memory", type=int, metavar="BYTES", help="memory budget of the cycle cache")
+parser.add_argument("-P", "--policy", choices=BUDGET_POLICIES, default="lru", help="eviction policy of the budget")
+parser.add_argument("-r", "--results", type=int, default=RESULT_LIMIT, metavar="N", help="query results to cache, 0 for none")
+parser.add_argument("-i", "--index", type=int, metavar="BLOCK", help="range-max index block size")
+parser.add_argument("-w", "--workers", type=int, help="worker processes for big ranges")
+parser.add_argument("-c", "--chunk", type=int, default=POOL_CHUNK, help="numbers per worker task")
+args = parser.parse_args()
+
+if args.results != RESULT_LIMIT :
+    collatz_result_cache(args.results)
+if args.memory :
+    collatz_cache_budget(args.memory, args.policy)
+if args.table :
+    collatz_load_table(args.table)
+if args.index :
+    collatz_range_index(args.index)
+if args.workers :
+    collatz_workers(args.workers, args.chunk)
+
+server = collatz_server(args.unix or (args.host, args.port), args.engine)
+if args.fill :
+    collatz_fill(collatz_engine(server.engine), 1, args.fill)
+try :
+    server.serve_forever()
+finally :
+    server.server_close()
+    if args.unix :
+        os.remove(args.unix)
@@ -17,16 +17,44 @@ To test the program:
 # imports
 # -------
 
+import base64
+import os
+import socket
 import StringIO
+import tempfile
+import threading
 import unittest
+import zlib
 
-from Collatz import collatz_read, collatz_eval, collatz_print, collatz_solve, do_bin, bin_collatz, check_meta, max_collatz
+import BenchCollatz
+import Collatz
+from Collatz import collatz_read, collatz_eval, collatz_print, collatz_solve, do_bin, bin_collatz, check_meta, max_collatz, \
+                    int_collatz, collatz_engine, CycleCache, MappedCycleCache, collatz_build_table, \
+                    collatz_load_table, RangeMaxIndex, vector_cycles, vector_fill, WorkerPool, collatz_workers, \
+                    collatz_range, collatz_plan, collatz_solve_batch, collatz_read_all, collatz_print_all, \
+                    HighCache, collatz_high_cache, collatz_records, collatz_build_records, collatz_load_records, \
+                    jump_build, jump_collatz, collatz_jump_bits, collatz_server, collatz_metrics, \
+                    collatz_snapshot, collatz_cycles, collatz_cycle_chunks, prune_build, collatz_prune, \
+                    collatz_fill, collatz_trajectory, collatz_trajectory_cache, collatz_eval_metric, \
+                    collatz_block_maxima, collatz_load_maxima, collatz_build_sphere, big_collatz, \
+                    collatz_eval_threads, collatz_solve_threads, ShardCache, collatz_shards, \
+                    collatz_read_binary, collatz_read_results, collatz_print_binary, collatz_write_queries, \
+                    BudgetCache, collatz_cache_budget, collatz_result_cache, tree_grow, tree_walk, collatz_tree_fill
 
 # -----------
 # TestCollatz
 # -----------
 
 class TestCollatz (unittest.TestCase) :
+    # every test goes past the result cache
+    # unless it turns on one of its own
+    def setUp (self) :
+        self.results = Collatz.result_cache
+        Collatz.result_cache = None
+
+    def tearDown (self) :
+        Collatz.result_cache = self.results
+
     # ----
     # read
     # ----
@@ -63,6 +91,35 @@ class TestCollatz (unittest.TestCase) :
         self.assert_(a[0] ==  22289)
         self.assert_(a[1] ==  199)
 
+    def test_read_all_1 (self) :
+        r = StringIO.StringIO("1 10\n382 948\n  999999   10 \n22289 199")
+        a = collatz_read_all(r, 7)
+        self.assert_(a == [(1, 10), (382, 948), (999999, 10), (22289, 199)])
+
+    def test_read_all_2 (self) :
+        r = StringIO.StringIO("1 10\n382\n")
+        try :
+            collatz_read_all(r)
+            self.fail()
+        except ValueError, e :
+            self.assert_("line 2" in str(e))
+
+    def test_read_all_3 (self) :
+        r = StringIO.StringIO("1 10\n2 3\n0 5\n")
+        self.assertRaises(ValueError, collatz_read_all, r, 4)
+        r = StringIO.StringIO("1 x\n")
+        self.assertRaises(ValueError, collatz_read_all, r)
+        self.assert_(collatz_read_all(StringIO.StringIO("")) == [])
+
+    def test_read_all_4 (self) :
+        for chunk in (4, 1 << 20) :
+            try :
+                collatz_read_all(StringIO.StringIO("1 2 3\n4\n"), chunk)
+                self.fail()
+            except ValueError, e :
+                self.assert_(str(e) == "line 1: expected two ints, got '1 2 3'")
+        self.assertRaises(ValueError, collatz_read_all, StringIO.StringIO("5 6\n1\n2 3 4\n"))
+
     # ----
     # do_bin
     # ----
@@ -95,6 +152,361 @@ class TestCollatz (unittest.TestCase) :
         c = bin_collatz(999999)
         self.assert_(c == 259)
 
+    # ----
+    # CycleCache
+    # ----
+
+    def test_cycle_cache_1 (self):
+        c = CycleCache(10)
+        self.assert_(c.get(5) == 0)
+        c.put(5, 6)
+        self.assert_(c.get(5) == 6)
+        self.assert_(c[5] == 6)
+
+    def test_cycle_cache_2 (self):
+        c = CycleCache(10)
+        c.put(10, 7)
+        c.put(123456, 7)
+        self.assert_(c.get(10) == 0)
+        self.assert_(c.get(123456) == 0)
+
+    def test_cycle_cache_3 (self):
+        c = CycleCache(10000)
+        for n in range(1, 10000):
+            c.put(n, n % 300)
+        self.assert_(c.range_max(1, 9999) == 299)
+        self.assert_(c.range_max(301, 310) == 10)
+        self.assert_(c.range_max(4100, 4100) == 200)
+
+    # ----
+    # HighCache
+    # ----
+
+    def test_high_cache_1 (self):
+        h = HighCache(4, 100)
+        h.keep(1000, 5)
+        self.assert_(h.get(1000) == 5)
+        self.assert_(h.get(2000) == 0)
+        self.assert_(h.stats()["hits"] == 1)
+        self.assert_(h.stats()["misses"] == 1)
+
+    def test_high_cache_2 (self):
+        h = HighCache(4, 100)
+        for n in range(1000, 1006):
+            h.keep(n, 1)
+        self.assert_(len(h) <= 4)
+        self.assert_(h.get(1005) == 1)
+        self.assert_(h.get(1000) == 0)
+        self.assert_(h.stats()["evictions"] == 4)
+
+    def test_high_cache_3 (self):
+        h = HighCache(8, 100)
+        h.put(50, 3)
+        h.put(500, 3)
+        self.assert_(h.get(50) == 3)
+        self.assert_(h.get(500) == 0)
+        c = CycleCache(10, h)
+        c.put(60, 4)
+        c.keep(600, 4)
+        self.assert_(c.get(60) == 4)
+        self.assert_(c.get(600) == 0)
+        self.assert_(c.recall(600) == 4)
+
+    def test_high_cache_4 (self):
+        saved = Collatz.cycle_list.high
+        try :
+            h = collatz_high_cache(1000)
+            self.assert_(collatz_eval(1000010, 1000020) == max(int_collatz(n) for n in range(1000010, 1000021)))
+            self.assert_(len(h) == 11)
+            self.assert_(collatz_eval(1000010, 1000020) > 0)
+            self.assert_(h.stats()["hits"] >= 11)
+        finally :
+            Collatz.cycle_list.high = saved
+
+    def test_high_cache_5 (self):
+        h = HighCache(4, 100)
+        h.keep(1000, 5)
+        h.keep(1001, 6)
+        self.assert_(h.get(1000) == 5)
+        self.assert_(len(h) == 2)
+        self.assert_(h.stats()["entries"] == 2)
+
+    def test_budget_cache_1 (self):
+        c = BudgetCache(1000, 2 * (16 + 3 * 16), "lru", 16, 16)
+        self.assert_(len(c) == 1000 and c.capacity == 3)
+        c.put(5, 6)
+        c.put(50, 25)
+        self.assert_(c.get(5) == 6 and c.get(50) == 25)
+        for n in (50, 100, 200) :
+            c.keep(n, 7)
+        c.recall(50)
+        c.keep(300, 8)
+        self.assert_([c.recall(n) for n in (50, 100, 200, 300)] == [7, 0, 7, 8])
+        c.put(100, 9)
+        self.assert_(c.get(100) == 0)
+        self.assert_(c.range_max(0, 999) == 8)
+        self.assert_(c.filled(5, 5) and not c.filled(50, 51))
+        stats = c.stats()
+        self.assert_(stats["evictions"] == 1 and stats["segments"] == 3 and stats["occupancy"] == 1.0)
+        self.assert_(stats["entries"] == 4 and stats["hits"] == 4 and stats["misses"] == 1)
+
+    def test_budget_cache_2 (self):
+        def victims (policy, keeps) :
+            c = BudgetCache(1000, 2 * (16 + 3 * 16), policy, 16, 16)
+            for n in keeps :
+                c.keep(n, 1)
+                c.touched = None
+            c.keep(300, 1)
+            return [n for n in (50, 100, 200) if not c.recall(n)]
+        once = (50, 50, 50, 100, 200)
+        twice = (50, 50, 50, 100, 100, 200, 200)
+        self.assert_(victims("lru", once) == [50] and victims("lru", twice) == [50])
+        self.assert_(victims("lfu", once) == [100] and victims("lfu", twice) == [100])
+        self.assert_(victims("slru", once) == [100] and victims("slru", twice) == [50])
+
+    def test_budget_cache_3 (self):
+        saved = Collatz.cycle_list
+        try :
+            for policy in ("lru", "lfu", "slru") :
+                c = collatz_cache_budget(2 * (256 + 8 * 256), policy, 20000, 256, 256)
+                self.assert_(Collatz.cycle_list is c)
+                for i, j in [(1, 10), (4000, 6000), (10000, 7000), (11000, 13000), (18000, 19999), (12000, 13200), (5, 5)] * 2 :
+                    self.assert_(collatz_eval(i, j) == max(bin_collatz(n) for n in range(min(i, j), max(i, j) + 1)))
+                stats = c.stats()
+                self.assert_(stats["evictions"] > 0 and stats["segments"] == 8)
+                self.assert_(0 < stats["hit_rate"] < 1)
+        finally :
+            Collatz.cycle_list = saved
+
+    # ----
+    # int_collatz
+    # ----
+
+    def test_int_collatz_1 (self):
+        c = int_collatz(9)
+        self.assert_(c == 20)
+
+    def test_int_collatz_2 (self):
+        c = int_collatz(871)
+        self.assert_(c == 179)
+
+    def test_int_collatz_3 (self):
+        for n in range(1, 3000):
+            self.assert_(int_collatz(n) == bin_collatz(n))
+
+    # ----
+    # jump_collatz
+    # ----
+
+    def test_jump_build_1 (self):
+        mult, add, odds = jump_build(4)
+        for r in range(16):
+            for a in range(5):
+                n = 16 * a + r
+                for step in range(4):
+                    n = (n * 3 + 1) // 2 if n & 1 else n // 2
+                self.assert_(mult[r] * a + add[r] == n)
+                self.assert_(mult[r] == 3 ** odds[r])
+
+    def test_jump_collatz_1 (self):
+        for n in range(1, 3000):
+            self.assert_(jump_collatz(n) == int_collatz(n))
+
+    def test_jump_collatz_2 (self):
+        saved = Collatz.jump_table
+        try:
+            for k in (1, 5, 16):
+                self.assert_(collatz_jump_bits(k)[0] == k)
+                for n in (3 ** 200, 3 ** 200 + 7, 2 ** 100 - 1):
+                    self.assert_(jump_collatz(n) == int_collatz(n))
+        finally:
+            Collatz.jump_table = saved
+
+    def test_jump_collatz_3 (self):
+        v = collatz_eval(1, 10, "jump")
+        self.assert_(v == 20)
+
+    # -----
+    # prune
+    # -----
+
+    def test_prune_build_1 (self):
+        self.assert_(prune_build(3)[5] == 1)
+        for bits in range(3, 9):
+            delta = prune_build(bits)
+            for r in range(1 << bits):
+                if not delta[r]:
+                    continue
+                for a in range(1, 6):
+                    n = (a << bits) + r - delta[r]
+                    m = (a << bits) + r
+                    odds = 0
+                    for step in range(bits):
+                        odds += (n & 1) - (m & 1)
+                        n = (n * 3 + 1) // 2 if n & 1 else n // 2
+                        m = (m * 3 + 1) // 2 if m & 1 else m // 2
+                    self.assert_(n == m and odds == 0)
+
+    def test_prune_build_2 (self):
+        delta = prune_build(10)
+        for n in range(1024, 20000):
+            if delta[n & 1023]:
+                self.assert_(int_collatz(n) == int_collatz(n - delta[n & 1023]))
+
+    def test_prune_3 (self):
+        saved = Collatz.cycle_list, Collatz.prune_delta
+        try :
+            tables = []
+            for bits in (None, 4, 10):
+                collatz_prune(bits)
+                Collatz.cycle_list = CycleCache(60000)
+                collatz_fill(int_collatz, 1, 59999)
+                tables.append(Collatz.cycle_list.table)
+            self.assert_(tables[0] == tables[1] == tables[2])
+        finally :
+            Collatz.cycle_list, Collatz.prune_delta = saved
+
+    # -----------
+    # big_collatz
+    # -----------
+
+    def cycle (self, n) :
+        c = 1
+        while n != 1 :
+            n = n * 3 + 1 if n & 1 else n // 2
+            c += 1
+        return c
+
+    def test_do_bin_4 (self):
+        b = do_bin(2 ** 5000 + 1)
+        self.assert_(b == "1" + "0" * 4999 + "1")
+
+    def test_big_collatz_1 (self):
+        for n in (2 ** 64 + 1, 3 ** 300, 3 ** 300 + 7, 2 ** 100 - 1, 2 ** 200):
+            c = self.cycle(n)
+            self.assert_(big_collatz(n) == c)
+            self.assert_(int_collatz(n) == c)
+            self.assert_(jump_collatz(n) == c)
+
+    def test_big_collatz_2 (self):
+        n = 2 ** 3000 + 5
+        self.assert_(big_collatz(n) == self.cycle(n))
+        self.assert_(bin_collatz(2 ** 1500 + 3) == self.cycle(2 ** 1500 + 3))
+
+    def test_big_collatz_3 (self):
+        n = 2 ** 70
+        v = collatz_eval(n + 5, n)
+        self.assert_(v == max(self.cycle(m) for m in range(n, n + 6)))
+        self.assert_(collatz_eval(n + 1, n + 1) == self.cycle(n + 1))
+
+    def test_big_collatz_4 (self):
+        for n in (2 ** 63 + 100, 2 ** 64) :
+            v = collatz_eval(n, n + 300)
+            self.assert_(v == max(self.cycle(m) for m in range(n, n + 301)))
+        n = 2 ** 64 - 3
+        self.assert_(list(collatz_cycles(n, n + 5, chunk=4)) == [(m, self.cycle(m)) for m in range(n, n + 6)])
+        self.assert_(collatz_eval_metric(n, n + 5, "cycle") == max(self.cycle(m) for m in range(n, n + 6)))
+
+    # ----
+    # vector_cycles
+    # ----
+
+    @unittest.skipIf(Collatz.numpy is None, "numpy is not installed")
+    def test_vector_cycles_1 (self):
+        saved = Collatz.cycle_list
+        try :
+            Collatz.cycle_list = CycleCache(100)
+            values = Collatz.numpy.arange(1, 3000, dtype=Collatz.numpy.uint64)
+            cycles = vector_cycles(values)
+            Collatz.cycle_list = CycleCache(100)
+            for n in range(1, 3000):
+                self.assert_(cycles[n - 1] == int_collatz(n))
+        finally :
+            Collatz.cycle_list = saved
+
+    @unittest.skipIf(Collatz.numpy is None, "numpy is not installed")
+    def test_vector_cycles_2 (self):
+        saved = Collatz.cycle_list
+        try :
+            Collatz.cycle_list = CycleCache(1000)
+            values = Collatz.numpy.array([27, 703, 871, 2 ** 62 + 1], dtype=Collatz.numpy.uint64)
+            cycles = vector_cycles(values)
+            self.assert_(list(cycles[:3]) == [112, 171, 179])
+            self.assert_(cycles[3] == int_collatz(2 ** 62 + 1))
+            self.assert_(Collatz.cycle_list.get(871) == 179)
+        finally :
+            Collatz.cycle_list = saved
+
+    @unittest.skipIf(Collatz.numpy is None, "numpy is not installed")
+    def test_vector_fill_1 (self):
+        saved = Collatz.cycle_list
+        try :
+            Collatz.cycle_list = CycleCache(1000)
+            m = vector_fill(900, 3000)
+            self.assert_(m == 217)
+            self.assert_(Collatz.cycle_list.range_max(900, 999) == 174)
+        finally :
+            Collatz.cycle_list = saved
+
+    @unittest.skipIf(Collatz.numpy is None, "numpy is not installed")
+    def test_vector_fill_2 (self):
+        v = collatz_eval(1200, 2200, "numpy")
+        self.assert_(v == 180)
+
+    @unittest.skipIf(Collatz.numpy is None, "numpy is not installed")
+    def test_vector_fill_3 (self):
+        saved = Collatz.cycle_list
+        lower = 1000001
+        upper = lower + Collatz.VECTOR_MIN_RANGE * 2
+        w = max(int_collatz(n) for n in range(lower, upper + 1))
+        try :
+            h = HighCache(4096, 0)
+            Collatz.cycle_list = CycleCache(1000, h)
+            v = collatz_eval(lower, upper, "numpy")
+            self.assert_(v == w)
+            self.assert_(len(h) == upper - lower + 1)
+            self.assert_(collatz_eval(lower, upper, "numpy") == v)
+            self.assert_(h.stats()["hits"] >= upper - lower + 1)
+        finally :
+            Collatz.cycle_list = saved
+
+    @unittest.skipIf(Collatz.numpy is None, "numpy is not installed")
+    def test_vector_fill_4 (self):
+        saved = Collatz.cycle_list, Collatz.prune_delta
+        try :
+            tables = []
+            for bits in (None, 4, 10):
+                collatz_prune(bits)
+                Collatz.cycle_list = CycleCache(60000)
+                collatz_metrics()
+                vector_fill(1, 100)
+                vector_fill(30000, 59999)
+                vector_fill(101, 29999)
+                tables.append(Collatz.cycle_list.table)
+                self.assert_((collatz_snapshot()["pruned"] > 0) == (bits is not None))
+                collatz_metrics(False)
+            self.assert_(tables[0] == tables[1] == tables[2])
+        finally :
+            collatz_metrics(False)
+            Collatz.cycle_list, Collatz.prune_delta = saved
+
+    # ----
+    # collatz_engine
+    # ----
+
+    def test_collatz_engine_1 (self):
+        self.assert_(collatz_engine("int") is int_collatz)
+
+    def test_collatz_engine_2 (self):
+        self.assert_(collatz_engine(bin_collatz) is bin_collatz)
+
+    def test_collatz_engine_3 (self):
+        self.assertRaises(ValueError, collatz_engine, "nope")
+
+    def test_collatz_engine_4 (self):
+        v = collatz_eval(900, 1000, "bin")
+        self.assert_(v == 174)
+
     # ----
     # check_meta
     # ----
@@ -110,6 +522,139 @@ class TestCollatz (unittest.TestCase) :
         m = check_meta(range(1, 999999))
         self.assert_(m == 525)
 
+    def test_check_meta_4 (self):
+        m = check_meta(xrange(3000, 3500))
+        self.assert_(m == 0)
+
+    def test_check_meta_5 (self):
+        m = check_meta(xrange(100, 100000000000))
+        self.assert_(m == 0 or Collatz.META_LIMIT >= 100000000000)
+        m = check_meta(xrange(837799, Collatz.META_LIMIT))
+        self.assert_(m >= 525)
+
+    # ----
+    # records
+    # ----
+
+    def test_records_1 (self):
+        r = collatz_records(1000)
+        self.assert_(r[:6] == [(1, 1), (2, 2), (3, 8), (6, 9), (7, 17), (9, 20)])
+        self.assert_(r[-1] == (871, 179))
+
+    def test_records_2 (self):
+        r = collatz_records(3000000)
+        self.assert_(r[43:] == [(837799, 525), (1117065, 528), (1501353, 531), (1723519, 557), (2298025, 560)])
+
+    def test_records_3 (self):
+        fd, path = tempfile.mkstemp()
+        w = os.fdopen(fd, "wb")
+        collatz_build_records(w, 2000)
+        w.close()
+        saved = Collatz.META_DICT, Collatz.META_KEYS, Collatz.META_LIMIT
+        try :
+            collatz_load_records(path)
+            self.assert_(Collatz.META_LIMIT == 2000)
+            self.assert_(Collatz.META_KEYS[-1] == 1161)
+            self.assert_(check_meta(xrange(1, 1999)) == 182)
+            self.assert_(check_meta(xrange(1, 2002)) == 0)
+        finally :
+            Collatz.META_DICT, Collatz.META_KEYS, Collatz.META_LIMIT = saved
+        open(path, "wb").write("nope")
+        self.assertRaises(ValueError, collatz_load_records, path)
+        os.remove(path)
+
+    # -------
+    # metrics
+    # -------
+
+    def test_metrics_1 (self) :
+        self.assert_(collatz_snapshot() == {})
+        collatz_eval(1, 10)
+        self.assert_(collatz_snapshot() == {})
+
+    def test_metrics_2 (self) :
+        try :
+            stats = collatz_metrics()
+            v = collatz_eval(1, 10)
+            self.assert_(v == 20)
+            s = collatz_snapshot()
+            self.assert_(s["queries"] == 1)
+            self.assert_(s["clamped"] == 1)
+            self.assert_(s["clamped_numbers"] == 4)
+            self.assert_(s["meta_hits"] == 1)
+            self.assert_(s["cache_misses"] == 0)
+            stats.reset()
+            self.assert_(collatz_snapshot()["queries"] == 0)
+        finally :
+            collatz_metrics(False)
+
+    def test_metrics_3 (self) :
+        saved = Collatz.cycle_list
+        w = StringIO.StringIO()
+        try :
+            Collatz.cycle_list = CycleCache(2000)
+            collatz_metrics(slow=0, log=w)
+            v = collatz_eval(1000, 900, "int")
+            self.assert_(v == 174)
+            s = collatz_snapshot()
+            self.assert_(s["cache_hits"] + s["cache_misses"] == 101)
+            self.assert_(s["engine_calls"] == s["cache_misses"] > 0)
+            self.assert_(s["engine_steps"] > 0)
+            self.assert_(s["slow_queries"] == 1)
+            self.assert_(w.getvalue().startswith("slow query 1000 900 174 "))
+        finally :
+            collatz_metrics(False)
+            Collatz.cycle_list = saved
+
+    def test_metrics_4 (self) :
+        saved = Collatz.cycle_list
+        def engine (n) :
+            if Collatz.collatz_stats is None :
+                collatz_metrics()
+            return int_collatz(n)
+        try :
+            Collatz.cycle_list = CycleCache(2000)
+            self.assert_(collatz_eval(1000, 900, engine) == 174)
+            self.assert_(collatz_snapshot()["queries"] == 0)
+            self.assert_(collatz_eval(1000, 900, engine) == 174)
+            self.assert_(collatz_snapshot()["queries"] == 1)
+        finally :
+            collatz_metrics(False)
+            Collatz.cycle_list = saved
+
+    # ------------
+    # result cache
+    # ------------
+
+    def test_result_cache_1 (self) :
+        c = collatz_result_cache(8)
+        self.assert_(Collatz.result_cache is c)
+        self.assert_(collatz_eval(10, 1) == 20)
+        self.assert_(collatz_eval(1, 10) == 20)
+        self.assert_(collatz_eval(5, 10) == 20)
+        self.assert_(len(c) == 1 and c.get((5, 10)) == 20)
+        self.assert_(c.stats()["hits"] == 3 and c.stats()["misses"] == 1)
+
+    def test_result_cache_2 (self) :
+        c = collatz_result_cache(4)
+        for n in range(1000, 1100, 10) :
+            self.assert_(collatz_eval(n, n + 5) == max(bin_collatz(k) for k in range(n, n + 6)))
+        self.assert_(len(c) <= 4 and c.stats()["evictions"] > 0)
+        self.assert_(collatz_result_cache(0) is None and Collatz.result_cache is None)
+
+    def test_result_cache_3 (self) :
+        collatz_result_cache()
+        r = StringIO.StringIO("1 10\n100 200\n10 1\n200 100\n201 210\n100 200\n")
+        w = StringIO.StringIO()
+        try :
+            collatz_metrics()
+            collatz_solve(r, w)
+            s = collatz_snapshot()
+            self.assert_(s["queries"] == 6 and s["result_hits"] == 3)
+        finally :
+            collatz_metrics(False)
+        self.assert_(w.getvalue() == "1 10 20\n100 200 125\n10 1 20\n200 100 125\n201 210 89\n100 200 125\n")
+
     # ----
     # max_collatz
     # ----
@@ -148,6 +693,256 @@ class TestCollatz (unittest.TestCase) :
         v = collatz_eval(900, 1000)
         self.assert_(v == 174)
 
+    # -----
+    # RangeMaxIndex
+    # -----
+
+    def test_range_index_1 (self):
+        i = RangeMaxIndex(Collatz.cycle_list, 16)
+        self.assert_(len(i.maxima) == 62500)
+        self.assert_(i.range_max(int_collatz, 1, 10) == 20)
+        self.assert_(i.range_max(int_collatz, 900, 1000) == 174)
+        self.assert_(i.maxima[60] == max(int_collatz(n) for n in range(960, 976)))
+
+    def test_range_index_2 (self):
+        i = RangeMaxIndex(Collatz.cycle_list, 100)
+        for lower, upper in [(1, 99), (150, 2999), (201, 210), (100, 199), (150, 2999)]:
+            m = max(int_collatz(n) for n in range(lower, upper + 1))
+            self.assert_(i.range_max(int_collatz, lower, upper) == m)
+
+    def test_range_index_3 (self):
+        saved = Collatz.range_index
+        try :
+            Collatz.collatz_range_index(16)
+            self.assert_(collatz_eval(900, 1000) == 174)
+            self.assert_(collatz_eval(201, 210) == 89)
+            self.assert_(Collatz.range_index.maxima[57] != 0)
+            self.assert_(Collatz.range_index.maxima[13] == 0)
+        finally :
+            Collatz.range_index = saved
+
+    # -----
+    # WorkerPool
+    # -----
+
+    def test_worker_pool_1 (self):
+        p = WorkerPool(2, 100, 0)
+        try :
+            m = p.range_max(int_collatz, 1200, 2200)
+            self.assert_(m == 180)
+            self.assert_(Collatz.cycle_list.filled(1200, 2200))
+        finally :
+            p.close()
+
+    def test_worker_pool_2 (self):
+        p = WorkerPool(2, 1000, 0)
+        try :
+            m = p.range_max(int_collatz, 999000, 1001000)
+            self.assert_(m == max(int_collatz(n) for n in range(999000, 1001001)))
+        finally :
+            p.close()
+
+    def test_worker_pool_3 (self):
+        try :
+            collatz_workers(2, 64, 256)
+            self.assert_(collatz_eval(201, 210) == 89)
+            self.assert_(collatz_eval(3000, 3500) == 199)
+        finally :
+            collatz_workers(0)
+        self.assert_(Collatz.worker_pool is None)
+
+    # -----
+    # table
+    # -----
+
+    def build_table (self, size):
+        fd, path = tempfile.mkstemp()
+        w = os.fdopen(fd, "wb")
+        collatz_build_table(w, size)
+        w.close()
+        return path
+
+    def test_table_1 (self):
+        path = self.build_table(1000)
+        t = MappedCycleCache(path)
+        self.assert_(len(t) == 1001)
+        self.assert_(t.get(9) == 20)
+        self.assert_(t.get(871) == 179)
+        self.assert_(t.get(5000) == 0)
+        self.assert_(t.range_max(900, 1000) == 174)
+        os.remove(path)
+
+    def test_table_2 (self):
+        path = self.build_table(10)
+        data = open(path, "rb").read()
+        open(path, "wb").write(data[:-1] + chr(ord(data[-1]) ^ 1))
+        self.assertRaises(ValueError, MappedCycleCache, path)
+        open(path, "wb").write("nope" + data[4:])
+        self.assertRaises(ValueError, MappedCycleCache, path)
+        os.remove(path)
+
+    def test_table_3 (self):
+        path = self.build_table(500)
+        saved = Collatz.cycle_list
+        try :
+            collatz_load_table(path)
+            self.assert_(collatz_eval(1, 10) == 20)
+            self.assert_(collatz_eval(400, 600) == 142)
+            self.assert_(collatz_eval(900, 1000) == 174)
+        finally :
+            Collatz.cycle_list = saved
+        os.remove(path)
+
+    def test_tree_1 (self):
+        table = [0, 1] + [0] * 98
+        tree_grow(table, [1])
+        self.assert_(table[8] == 4 and table[5] == 6 and table[3] == 8)
+        self.assert_(table[27] == 0 and table[33] == 0)
+        self.assert_(tree_walk(table, 27) == self.cycle(27) == 112)
+        self.assert_(tree_walk(table, 33) == self.cycle(33))
+
+    def test_tree_2 (self):
+        saved = Collatz.cycle_list, Collatz.numpy
+        try :
+            tables = []
+            for vector in (False, True) :
+                if not vector :
+                    Collatz.numpy = None
+                Collatz.cycle_list = CycleCache(30000)
+                collatz_tree_fill()
+                tables.append(Collatz.cycle_list.table)
+                Collatz.cycle_list, Collatz.numpy = saved
+            self.assert_(tables[0] == tables[1])
+            self.assert_(list(tables[0][:10]) == [0, 1, 2, 8, 3, 6, 9, 17, 4, 20])
+            self.assert_(all(tables[0][n] == self.cycle(n) for n in range(1, 30000, 37)))
+        finally :
+            Collatz.cycle_list, Collatz.numpy = saved
+
+    def test_tree_3 (self):
+        w = StringIO.StringIO()
+        collatz_build_table(w, 5000, tree=True)
+        path = self.build_table(5000)
+        self.assert_(w.getvalue() == open(path, "rb").read())
+        os.remove(path)
+
+    # ------
+    # sphere
+    # ------
+
+    def test_block_maxima_1 (self) :
+        m = collatz_block_maxima(3000, 1000)
+        self.assert_(list(m) == [179, 182, 217])
+        self.assert_(list(collatz_block_maxima(3500, 1000)) == [179, 182, 217])
+
+    def test_load_maxima_1 (self) :
+        saved = Collatz.range_index
+        try :
+            m = collatz_block_maxima(3000, 1000)
+            collatz_load_maxima(base64.b64encode(zlib.compress(m.tostring())), 1000)
+            self.assert_(list(Collatz.range_index.maxima[:4]) == [179, 182, 217, 0])
+            self.assert_(collatz_eval(1500, 2990) == 217)
+        finally :
+            Collatz.range_index = saved
+
+    def test_build_sphere_1 (self) :
+        w = StringIO.StringIO()
+        collatz_build_sphere(w, 2000, 100)
+        source = w.getvalue()
+        compile(source, "SphereCollatz.py", "exec")
+        self.assert_(source.startswith("#!/usr/bin/env python\n\n# ---------------------------------\n"))
+        self.assert_("SPHERE_MAXIMA" in source)
+        self.assert_(source.endswith("collatz_load_maxima(SPHERE_MAXIMA, 100)\ncollatz_solve(sys.stdin, sys.stdout)\n"))
+
+    # -----
+    # range
+    # -----
+
+    def test_range_1 (self) :
+        self.assert_(collatz_range(10, 1) == (5, 10))
+        self.assert_(collatz_range(1, 10) == (5, 10))
+        self.assert_(collatz_range(5, 10) == (5, 10))
+
+    def test_range_2 (self) :
+        self.assert_(collatz_range(900, 1000) == (900, 1000))
+        self.assert_(collatz_range(7, 7) == (7, 7))
+
+    # -----
+    # plan
+    # -----
+
+    def test_plan_1 (self) :
+        p = collatz_plan([(1, 10), (10, 1), (100, 200), (201, 210)])
+        self.assert_(p == [[5, 10], [100, 210]])
+
+    def test_plan_2 (self) :
+        p = collatz_plan([(900, 1000), (950, 960), (1002, 1003), (1, 1)])
+        self.assert_(p == [[1, 1], [900, 1000], [1002, 1003]])
+
+    def test_plan_3 (self) :
+        self.assert_(collatz_plan([]) == [])
+
+    # ----------
+    # trajectory
+    # ----------
+
+    def walk (self, n) :
+        seq = [n]
+        while n != 1 :
+            n = n * 3 + 1 if n & 1 else n // 2
+            seq.append(n)
+        stop = ([k for k, m in enumerate(seq) if m < seq[0]] + [0])[0]
+        return len(seq), max(seq), sum(m & 1 for m in seq[:-1]), stop
+
+    def test_trajectory_1 (self) :
+        self.assert_(collatz_trajectory(1) == (1, 1, 0, 0))
+        self.assert_(collatz_trajectory(3) == (8, 16, 2, 6))
+        self.assert_(collatz_trajectory(27) == (112, 9232, 41, 96))
+
+    def test_trajectory_2 (self) :
+        saved = Collatz.trajectory_list
+        try :
+            collatz_trajectory_cache(100)
+            for n in [5000, 97, 3 ** 40] + range(1, 300) :
+                self.assert_(collatz_trajectory(n) == self.walk(n))
+        finally :
+            Collatz.trajectory_list = saved
+
+    def test_trajectory_3 (self) :
+        saved = Collatz.trajectory_list
+        try :
+            collatz_trajectory_cache(500)
+            metrics = [self.walk(n) for n in range(1, 1001)]
+            for i, j in [(1, 10), (10, 1), (300, 700), (450, 520), (900, 1000), (1, 1)] :
+                for k, name in enumerate(("cycle", "peak", "odd", "stop")) :
+                    v = collatz_eval_metric(i, j, name)
+                    self.assert_(v == max(m[k] for m in metrics[min(i, j) - 1:max(i, j)]))
+            self.assertRaises(ValueError, collatz_eval_metric, 1, 10, "steps")
+        finally :
+            Collatz.trajectory_list = saved
+
+    # ------
+    # cycles
+    # ------
+
+    def test_cycles_1 (self) :
+        c = list(collatz_cycles(1, 10))
+        self.assert_(c == zip(range(1, 11), [1, 2, 8, 3, 6, 9, 17, 4, 20, 7]))
+
+    def test_cycles_2 (self) :
+        c = list(collatz_cycle_chunks(10, 1, "int", 3))
+        self.assert_([len(pairs) for pairs in c] == [3, 3, 3, 1])
+        self.assert_(sum(c, []) == list(collatz_cycles(1, 10)))
+        self.assert_(max(cycle for n, cycle in collatz_cycles(900, 1000)) == 174)
+
+    def test_cycles_3 (self) :
+        saved = Collatz.cycle_list
+        try :
+            Collatz.cycle_list = CycleCache(100)
+            c = list(collatz_cycles(95, 105, "int", 4))
+            self.assert_(c == [(n, bin_collatz(n)) for n in range(95, 106)])
+        finally :
+            Collatz.cycle_list = saved
+
     # -----
     # print
     # -----
@@ -172,6 +967,21 @@ class TestCollatz (unittest.TestCase) :
         collatz_print(w, 999999, 235, 132)
         self.assert_(w.getvalue() == "999999 235 132\n")
 
+    def test_print_all_1 (self) :
+        w = StringIO.StringIO()
+        collatz_print_all(w, [(1, 10, 20), (7, 7, 17)])
+        self.assert_(w.getvalue() == "1 10 20\n7 7 17\n")
+
+    def test_print_all_2 (self) :
+        w = StringIO.StringIO()
+        collatz_print_all(w, ((n, n, n) for n in range(1, 6)), 2)
+        self.assert_(w.getvalue() == "1 1 1\n2 2 2\n3 3 3\n4 4 4\n5 5 5\n")
+
+    def test_print_all_3 (self) :
+        w = StringIO.StringIO()
+        collatz_print_all(w, [])
+        self.assert_(w.getvalue() == "")
+
     # -----
     # solve
     # -----
@@ -199,6 +1009,263 @@ class TestCollatz (unittest.TestCase) :
         w = StringIO.StringIO()
         collatz_solve(r, w)
         self.assert_(w.getvalue() == "")
+
+    # ------------
+    # solve binary
+    # ------------
+
+    def test_binary_1 (self) :
+        w = StringIO.StringIO()
+        collatz_write_queries(w, [(1, 10), (2 ** 64 - 1, 5)])
+        self.assert_(w.getvalue().startswith("CLTQ\x01\x00"))
+        self.assert_(list(collatz_read_binary(memoryview(w.getvalue()))) == [(1, 10), (2 ** 64 - 1, 5)])
+        w = StringIO.StringIO()
+        collatz_print_binary(w, [(1, 10, 20), (900, 1000, 174)], 1)
+        self.assert_(list(collatz_read_results(w.getvalue())) == [(1, 10, 20), (900, 1000, 174)])
+
+    def test_binary_2 (self) :
+        self.assertRaises(ValueError, list, collatz_read_binary("1 10\n"))
+        self.assertRaises(ValueError, list, collatz_read_binary("CLTQ\x02\x00"))
+        self.assertRaises(ValueError, list, collatz_read_binary("CLTQ\x01\x00" + "\x00" * 15))
+        self.assertRaises(ValueError, list, collatz_read_results("CLTQ\x01\x00"))
+        w = StringIO.StringIO()
+        collatz_write_queries(w, [(1, 10), (0, 5)])
+        try :
+            list(collatz_read_binary(w.getvalue()))
+            self.assert_(False)
+        except ValueError as e :
+            self.assert_(str(e) == "record 1: expected positive ints, got 0 5")
+
+    def test_solve_binary_1 (self) :
+        q = StringIO.StringIO()
+        collatz_write_queries(q, [(1, 10), (100, 200), (201, 210), (900, 1000)])
+        r = StringIO.StringIO(q.getvalue())
+        w = StringIO.StringIO()
+        collatz_solve(r, w)
+        v = list(collatz_read_results(w.getvalue()))
+        self.assert_(v == [(1, 10, 20), (100, 200, 125), (201, 210, 89), (900, 1000, 174)])
+
+    def test_solve_binary_2 (self) :
+        f = tempfile.TemporaryFile()
+        try :
+            collatz_write_queries(f, [(1000, 900), (1, 1)])
+            f.seek(0)
+            w = StringIO.StringIO()
+            collatz_solve(f, w)
+            self.assert_(list(collatz_read_results(w.getvalue())) == [(1000, 900, 174), (1, 1, 1)])
+        finally :
+            f.close()
+        r = StringIO.StringIO("1 1\n10 1\n")
+        w = StringIO.StringIO()
+        collatz_solve(r, w)
+        self.assert_(w.getvalue() == "1 1 1\n10 1 20\n")
+
+    def test_solve_binary_3 (self) :
+        q = StringIO.StringIO()
+        collatz_write_queries(q, [(1, 10), (1000, 900), (1, 1)])
+        for solve in (collatz_solve_batch, collatz_solve_threads) :
+            w = StringIO.StringIO()
+            solve(StringIO.StringIO(q.getvalue()), w)
+            self.assert_(list(collatz_read_results(w.getvalue())) == [(1, 10, 20), (1000, 900, 174), (1, 1, 1)])
+        f = tempfile.TemporaryFile()
+        try :
+            f.write(q.getvalue())
+            f.seek(0)
+            w = StringIO.StringIO()
+            collatz_solve_batch(f, w)
+            self.assert_(list(collatz_read_results(w.getvalue())) == [(1, 10, 20), (1000, 900, 174), (1, 1, 1)])
+        finally :
+            f.close()
+        w = StringIO.StringIO()
+        collatz_solve_threads(StringIO.StringIO("1 1\n10 1"), w)
+        self.assert_(w.getvalue() == "1 1 1\n10 1 20\n")
+
+    # -----
+    # solve_batch
+    # -----
+
+    def test_solve_batch_1 (self) :
+        r = StringIO.StringIO("1 10\n100 200\n201 210\n900 1000\n")
+        w = StringIO.StringIO()
+        collatz_solve_batch(r, w)
+        self.assert_(w.getvalue() == "1 10 20\n100 200 125\n201 210 89\n900 1000 174\n")
+
+    def test_solve_batch_2 (self) :
+        r = StringIO.StringIO("1000 900\n1 1\n1000 900\n999999 1000001\n")
+        w = StringIO.StringIO()
+        collatz_solve_batch(r, w, "int")
+        self.assert_(w.getvalue() == "1000 900 174\n1 1 1\n1000 900 174\n999999 1000001 259\n")
+
+    def test_solve_batch_3 (self) :
+        r = StringIO.StringIO("")
+        w = StringIO.StringIO()
+        collatz_solve_batch(r, w)
+        self.assert_(w.getvalue() == "")
+
+    def test_solve_batch_4 (self) :
+        saved = Collatz.cycle_list
+        try :
+            Collatz.cycle_list = CycleCache(5000)
+            collatz_metrics()
+            r = StringIO.StringIO("1 10\n700 800\n3000 3500\n3500 3000\n4000 4500\n")
+            w = StringIO.StringIO()
+            collatz_solve_batch(r, w, "int")
+            self.assert_(w.getvalue() == "1 10 20\n700 800 171\n3000 3500 199\n3500 3000 199\n4000 4500 215\n")
+            self.assert_(collatz_snapshot()["meta_hits"] == 2)
+            self.assert_(Collatz.cycle_list.filled(3000, 3500) and not Collatz.cycle_list.filled(700, 800))
+        finally :
+            collatz_metrics(False)
+            Collatz.cycle_list = saved
+
+    # -------
+    # threads
+    # -------
+
+    def test_eval_threads_1 (self) :
+        q = [(1, 10), (100, 200), (201, 210), (900, 1000)]
+        self.assert_(collatz_eval_threads(q) == [(1, 10, 20), (100, 200, 125), (201, 210, 89), (900, 1000, 174)])
+        self.assert_(collatz_eval_threads([]) == [])
+
+    def test_eval_threads_2 (self) :
+        saved = Collatz.cycle_list
+        try :
+            q = [(n, n + 499) for n in range(1, 7000, 113)] * 2
+            Collatz.cycle_list = CycleCache(5000, HighCache(64))
+            expected = [(i, j, collatz_eval(i, j, "int")) for i, j in q]
+            Collatz.cycle_list = CycleCache(5000, HighCache(64))
+            self.assert_(collatz_eval_threads(q, "int", 8) == expected)
+            table = Collatz.cycle_list.table
+            for n in range(1, 5000) :
+                self.assert_(table[n] in (0, bin_collatz(n)))
+        finally :
+            Collatz.cycle_list = saved
+
+    def test_solve_threads_1 (self) :
+        r = StringIO.StringIO("1 10\n1000 900\n999999 1000001\n")
+        w = StringIO.StringIO()
+        collatz_solve_threads(r, w, "jump", 2)
+        self.assert_(w.getvalue() == "1 10 20\n1000 900 174\n999999 1000001 259\n")
+
+    # ------
+    # shards
+    # ------
+
+    def test_shard_cache_1 (self) :
+        c = ShardCache(100, 200, 10)
+        self.assert_(len(c) == 200)
+        c.put(5, 6)
+        c.put(50, 25)
+        c.put(150, 16)
+        c.put(250, 110)
+        self.assert_([c.get(n) for n in (5, 50, 150, 250)] == [6, 0, 16, 0])
+        self.assert_(c.range_max(100, 199) == 16)
+        self.assert_(not c.filled(100, 150))
+
+    def test_shard_cache_2 (self) :
+        saved = Collatz.cycle_list
+        try :
+            Collatz.cycle_list = ShardCache(500, 1000, 100, HighCache(16))
+            self.assert_(collatz_eval(900, 1000) == 174)
+            self.assert_(Collatz.cycle_list.filled(900, 999))
+            self.assert_(collatz_eval(1000, 1100) == 169)
+        finally :
+            Collatz.cycle_list = saved
+
+    def test_shards_1 (self) :
+        try :
+            collatz_shards(3, 3000)
+            for i, j in [(1, 10), (100, 200), (201, 210), (900, 1000), (1000, 2999), (2500, 4000), (5, 5)] :
+                self.assert_(collatz_eval(i, j) == max(bin_collatz(n) for n in range(min(i, j), max(i, j) + 1)))
+        finally :
+            collatz_shards(0)
+        self.assert_(Collatz.shard_pool is None)
+
+    # -----
+    # serve
+    # -----
+
+    def serve (self, address, queries) :
+        server = collatz_server(address)
+        t = threading.Thread(target=server.serve_forever)
+        t.start()
+        try :
+            clients = []
+            for q in queries :
+                c = socket.socket(server.address_family)
+                c.connect(server.server_address)
+                c.sendall(q)
+                c.shutdown(socket.SHUT_WR)
+                clients.append(c)
+            answers = []
+            for c in clients :
+                answers.append(c.makefile().read())
+                c.close()
+            return answers
+        finally :
+            server.shutdown()
+            server.server_close()
+            t.join()
+
+    def test_serve_1 (self) :
+        a = self.serve(("localhost", 0), ["1 10\n100 200\n201 210\n900 1000\n"])
+        self.assert_(a == ["1 10 20\n100 200 125\n201 210 89\n900 1000 174\n"])
+
+    def test_serve_2 (self) :
+        a = self.serve(("localhost", 0), ["1 10\n", "1000 900\n" * 100, ""])
+        self.assert_(a == ["1 10 20\n", "1000 900 174\n" * 100, ""])
+
+    def test_serve_3 (self) :
+        path = tempfile.mktemp(suffix=".sock")
+        try :
+            a = self.serve(path, ["999999 1000001\n", "1 1\n"])
+            self.assert_(a == ["999999 1000001 259\n", "1 1 1\n"])
+        finally :
+            os.remove(path)
+
+    def test_serve_4 (self) :
+        a = self.serve(("localhost", 0), ["1 10\n0 5\n2 3\nx 1\n\n100 200\n"])
+        self.assert_(a == ["1 10 20\n"
+                           "line 2: expected positive ints, got '0 5'\n"
+                           "2 3 8\n"
+                           "line 4: expected two ints, got 'x 1'\n"
+                           "line 5: expected two ints, got ''\n"
+                           "100 200 125\n"])
+
+    # -----
+    # bench
+    # -----
+
+    def test_bench_check_1 (self) :
+        old = {"full/int/cold" : {"qps" : 100.0, "p99" : 0.01},
+               "full/int/warm" : {"qps" : 100.0, "p99" : 0.00001}}
+        new = {"full/int/cold" : {"qps" : 81.0, "p99" : 0.012},
+               "full/int/warm" : {"qps" : 100.0, "p99" : 0.00005},
+               "high/int/cold" : {"qps" : 1.0, "p99" : 9.0}}
+        self.assert_(BenchCollatz.bench_check(new, old, 0.2) == [])
+
+    def test_bench_check_2 (self) :
+        old = {"full/int/cold" : {"qps" : 100.0, "p99" : 0.01}}
+        new = {"full/int/cold" : {"qps" : 79.0, "p99" : 0.0121 + BenchCollatz.BENCH_SLACK}}
+        self.assert_(BenchCollatz.bench_check(new, old, 0.2) ==
+                     ["full/int/cold qps 100.0 -> 79.0", "full/int/cold p99 0.010000 -> 0.012200"])
+        self.assert_(BenchCollatz.bench_check(new, old, 0.5) == [])
+
+    def test_bench_records (self) :
+        saved = Collatz.cycle_list
+        try :
+            Collatz.cycle_list = CycleCache(2000)
+            collatz_metrics()
+            BenchCollatz.bench_records(False)
+            self.assert_(collatz_eval(1, 1999, "int") == 182)
+            self.assert_(collatz_snapshot()["meta_hits"] == 0)
+            BenchCollatz.bench_records(True)
+            self.assert_(collatz_eval(1, 1999, "int") == 182)
+            self.assert_(collatz_snapshot()["meta_hits"] == 1)
+        finally :
+            BenchCollatz.bench_records(True)
+            collatz_metrics(False)
+            Collatz.cycle_list = saved
+
 # ----
 # main
 # ----